@@ -0,0 +1,13 @@
+"""
+Benchmarks for the hot paths of shared.python (file, serialize, utils).
+
+run them and save a baseline:
+    python -m shared.python.benchmark run --output baseline.json
+
+run them again later and compare:
+    python -m shared.python.benchmark run --output current.json
+    python -m shared.python.benchmark compare baseline.json current.json --threshold 0.15
+
+compare exits with 1 when a benchmark got slower (or used more memory) than the baseline by more than
+the threshold. Everything runs offline, fixtures are generated in a temporary folder.
+"""
@@ -0,0 +1,68 @@
+"""
+python -m shared.python.benchmark run --output results.json
+python -m shared.python.benchmark compare baseline.json results.json
+"""
+# python
+import argparse
+import sys
+
+# internal
+from shared.python.benchmark import measure
+from shared.python.benchmark import suite
+
+
+def _print(line):
+    sys.stdout.write(line + "\n")
+    sys.stdout.flush()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m shared.python.benchmark")
+    subparsers = parser.add_subparsers(dest="command")
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("names", nargs="*", help="glob patterns of the benchmarks to run, example: 'file.*'")
+    run_parser.add_argument("--output", "-o", help="save the results to this json file")
+    run_parser.add_argument("--scale", default="small", choices=sorted(suite.fixtures_.SCALES))
+    run_parser.add_argument("--warmup", type=int, default=1)
+    run_parser.add_argument("--repeat", type=int, default=5)
+
+    compare_parser = subparsers.add_parser("compare", help="compare results against a baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="ratio of slow down that counts as a regression, 0.1 is 10%%")
+    compare_parser.add_argument("--memory-threshold", type=float, default=None)
+
+    subparsers.add_parser("list", help="list the benchmarks")
+
+    options = parser.parse_args(args)
+
+    if options.command == "list":
+        for name in suite.BENCHMARKS:
+            _print(name)
+        return 0
+
+    if options.command == "run":
+        results = suite.run_benchmarks(options.names, scale=options.scale, warmup=options.warmup,
+                                       repeat=options.repeat, log=_print)
+        if options.output:
+            suite.save_results(options.output, results)
+        return 0
+
+    try:
+        rows = measure.compare(suite.load_results(options.baseline), suite.load_results(options.current),
+                               threshold=options.threshold, memory_threshold=options.memory_threshold)
+    except measure.IncomparableResults as e:
+        _print("can't compare: {0}".format(e))
+        return 2
+    _print(suite.format_comparison(rows))
+    regressions = [row for row in rows if row["regressed"]]
+    if regressions:
+        _print("{0} regression(s) above {1:.0%}".format(len(regressions), options.threshold))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""
+Synthetic data for the benchmarks. Everything is generated from a seed so two runs on the same
+machine work on the same data.
+"""
+# python
+import os
+import random
+import shutil
+import string
+import tempfile
+
+# internal
+import shared.python.serialize as serialize
+
+# bump when the generated data changes, results made from different fixtures can't be compared
+FIXTURES_VERSION = 1
+
+# size of the generated data per scale
+SCALES = {
+    "small": {"tree_depth": 3, "tree_width": 3, "files_per_dir": 10, "file_size": 256,
+              "json_keys": 2000, "json_depth": 4, "tags": 2000, "tag_vocabulary": 100,
+              "hash_file_size": 32 * 1024 * 1024},
+    "medium": {"tree_depth": 4, "tree_width": 4, "files_per_dir": 20, "file_size": 1024,
+               "json_keys": 20000, "json_depth": 6, "tags": 10000, "tag_vocabulary": 300,
+               "hash_file_size": 256 * 1024 * 1024},
+    "large": {"tree_depth": 5, "tree_width": 5, "files_per_dir": 30, "file_size": 4096,
+              "json_keys": 100000, "json_depth": 8, "tags": 50000, "tag_vocabulary": 1000,
+              "hash_file_size": 1024 * 1024 * 1024},
+}
+
+
+def _word(rng, length=8):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def make_tree(root, depth=3, width=3, files_per_dir=10, file_size=256, seed=0):
+    """
+    Creates a directory tree 'depth' levels deep with 'width' sub folders per folder
+    and 'files_per_dir' files of 'file_size' bytes in every folder.
+
+    Returns:
+        (int) number of files created
+    """
+    rng = random.Random(seed)
+    extensions = [".ma", ".mb", ".json", ".png", ".txt"]
+    created = 0
+    stack = [(root, 0)]
+    while stack:
+        folder, level = stack.pop()
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        for i in range(files_per_dir):
+            path = os.path.join(folder, "file_{0:04d}{1}".format(i, rng.choice(extensions)))
+            with open(path, "wb") as f:
+                f.write(os.urandom(file_size) if file_size else b"")
+            created += 1
+        if level < depth:
+            for i in range(width):
+                stack.append((os.path.join(folder, "dir_{0:02d}".format(i)), level + 1))
+    return created
+
+
+def make_json_document(keys=2000, depth=4, seed=0):
+    """
+    Returns a nested dict/list document with about 'keys' leaf values, nested up to 'depth' levels.
+    """
+    rng = random.Random(seed)
+    document = dict()
+    for i in range(keys):
+        node = document
+        for level in range(rng.randint(0, depth - 1)):
+            node = node.setdefault("group_{0}".format(rng.randint(0, 9)), dict())
+        kind = rng.randint(0, 3)
+        if kind == 0:
+            value = rng.random()
+        elif kind == 1:
+            value = _word(rng)
+        elif kind == 2:
+            value = [rng.randint(0, 1000) for _ in range(5)]
+        else:
+            value = {"name": _word(rng), "enabled": bool(rng.randint(0, 1))}
+        node["key_{0}".format(i)] = value
+    return document
+
+
+def make_tag_list(size=2000, vocabulary=100, seed=0):
+    """
+    Returns a list of 'size' strings drawn from 'vocabulary' distinct words with a skewed distribution,
+    like the tags of an asset library.
+    """
+    rng = random.Random(seed)
+    words = [_word(rng, 6) for _ in range(vocabulary)]
+    return [words[min(int(rng.paretovariate(1.2)) - 1, vocabulary - 1)] for _ in range(size)]
+
+
+class Fixtures(object):
+    """
+    Creates the fixtures the first time they are asked for, inside a temporary folder that is
+    removed by cleanup().
+    """
+
+    def __init__(self, scale="small", root=None, seed=0):
+        self.scale = scale
+        self.settings = SCALES[scale]
+        self.seed = seed
+        self._owns_root = root is None
+        self.root = root or tempfile.mkdtemp(prefix="shared_benchmark_")
+        self._cache = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.cleanup()
+
+    def path(self, *args):
+        return os.path.join(self.root, *args)
+
+    def tree(self):
+        """ Returns: (str) root of a generated directory tree """
+        if "tree" not in self._cache:
+            root = self.path("tree")
+            s = self.settings
+            make_tree(root, s["tree_depth"], s["tree_width"], s["files_per_dir"], s["file_size"], seed=self.seed)
+            self._cache["tree"] = root
+        return self._cache["tree"]
+
+    def json_document(self):
+        if "json_document" not in self._cache:
+            self._cache["json_document"] = make_json_document(self.settings["json_keys"], self.settings["json_depth"],
+                                                              seed=self.seed)
+        return self._cache["json_document"]
+
+    def json_file(self):
+        """ Returns: (str) path of the json document saved to disk """
+        if "json_file" not in self._cache:
+            path = self.path("document.json")
+            serialize.save(path, self.json_document())
+            self._cache["json_file"] = path
+        return self._cache["json_file"]
+
+    def tags(self):
+        if "tags" not in self._cache:
+            self._cache["tags"] = make_tag_list(self.settings["tags"], self.settings["tag_vocabulary"], seed=self.seed)
+        return self._cache["tags"]
+
+    def big_file(self, size=64 * 1024 * 1024):
+        """ Returns: (str) path of a file of 'size' random bytes """
+        key = "big_file_{0}".format(size)
+        if key not in self._cache:
+            path = self.path("big_{0}.bin".format(size))
+            chunk = os.urandom(1024 * 1024)
+            with open(path, "wb") as f:
+                remaining = size
+                while remaining > 0:
+                    f.write(chunk[:remaining])
+                    remaining -= len(chunk)
+            self._cache[key] = path
+        return self._cache[key]
+
+    def cleanup(self):
+        if self._owns_root and os.path.isdir(self.root):
+            shutil.rmtree(self.root, ignore_errors=True)
+        self._cache.clear()
@@ -0,0 +1,163 @@
+"""
+Timing and memory measurement for the benchmarks.
+"""
+# python
+import gc
+import math
+import timeit
+
+
+# meta values that have to be the same for two results to be compared, with the value of the results
+# saved before they were recorded
+COMPARABLE_META = (("scale", None), ("fixtures_version", 1))
+
+
+class IncomparableResults(ValueError):
+    pass
+
+
+def _read_status(key):
+    # /proc/self/status values are in kB
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(key + ":"):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+
+def _reset_peak_memory():
+    # linux 4.0+ resets the VmHWM (peak resident memory) of the process to its current value
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def _stats(values):
+    values = sorted(values)
+    count = len(values)
+    mean = sum(values) / float(count)
+    middle = count // 2
+    median = values[middle] if count % 2 else (values[middle - 1] + values[middle]) / 2.0
+    variance = sum((v - mean) ** 2 for v in values) / float(count)
+    return {"min": values[0], "max": values[-1], "mean": mean, "median": median, "stdev": math.sqrt(variance)}
+
+
+def measure(fn, warmup=1, repeat=5, number=1, work=None):
+    """
+    Times fn() after 'warmup' untimed calls.
+
+    Args:
+        fn:
+            function to time, called without arguments
+        warmup:
+            (int) calls before timing, fills the caches (file system, imports...)
+        repeat:
+            (int) how many timings are taken
+        number:
+            (int) calls per timing, the times are divided by it
+        work:
+            (int) bytes processed by one call of fn, adds a throughput figure (bytes per second)
+
+    Returns:
+        (dict) min, max, mean, median and stdev in seconds per call,
+        peak_memory: growth of the peak resident memory while timing, in bytes (None if not on linux),
+        throughput: bytes per second based on the median, if 'work' is given
+    """
+    for _ in range(warmup):
+        fn()
+
+    gc.collect()
+    baseline = _read_status("VmRSS")
+    peak_supported = _reset_peak_memory() and baseline is not None
+
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        times = list()
+        for _ in range(repeat):
+            time_start = timeit.default_timer()
+            for _ in range(number):
+                fn()
+            times.append((timeit.default_timer() - time_start) / number)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    result = _stats(times)
+    result["repeat"] = repeat
+    result["number"] = number
+    result["peak_memory"] = None
+    if peak_supported:
+        peak = _read_status("VmHWM")
+        if peak is not None:
+            result["peak_memory"] = max(0, peak - baseline)
+
+    if work:
+        result["work"] = work
+        result["throughput"] = work / result["median"] if result["median"] else None
+    return result
+
+
+def compare(baseline, current, threshold=0.1, memory_threshold=None, min_time=1e-4, min_memory=1024 * 1024):
+    """
+    Compares two results of run_benchmarks.
+
+    Args:
+        baseline:
+            (dict) results saved earlier
+        current:
+            (dict) new results
+        threshold:
+            (float) a benchmark regressed if its median time grew by more than this ratio (0.1 = 10%)
+        memory_threshold:
+            (float) same for the peak memory, defaults to threshold
+        min_time:
+            (float) seconds, medians below that are too noisy to be flagged
+        min_memory:
+            (int) bytes, memory growth below that is not flagged
+
+    Returns:
+        (list) of dicts, one per benchmark found in both results:
+        name, baseline, current, ratio, memory_ratio, regressed (bool)
+    Raises:
+        IncomparableResults if the results were made with a different scale or version of the fixtures
+    """
+    for key, default in COMPARABLE_META:
+        base_value = baseline.get("meta", dict()).get(key, default)
+        current_value = current.get("meta", dict()).get(key, default)
+        if base_value != current_value:
+            raise IncomparableResults("the baseline was made with {0} {1!r}, the current results with {2!r}".format(
+                key, base_value, current_value))
+
+    if memory_threshold is None:
+        memory_threshold = threshold
+
+    rows = list()
+    baseline_results = baseline.get("results", dict())
+    for name, result in sorted(current.get("results", dict()).items()):
+        base = baseline_results.get(name)
+        if not base:
+            continue
+
+        ratio = result["median"] / base["median"] if base["median"] else None
+        regressed = False
+        if ratio is not None and max(result["median"], base["median"]) >= min_time:
+            regressed = ratio > 1.0 + threshold
+
+        memory_ratio = None
+        if base.get("peak_memory") is not None and result.get("peak_memory") is not None:
+            growth = result["peak_memory"] - base["peak_memory"]
+            if base["peak_memory"]:
+                memory_ratio = result["peak_memory"] / float(base["peak_memory"])
+            if growth >= min_memory and (memory_ratio is None or memory_ratio > 1.0 + memory_threshold):
+                regressed = True
+
+        rows.append({"name": name, "baseline": base["median"], "current": result["median"],
+                     "ratio": ratio, "memory_ratio": memory_ratio, "regressed": regressed})
+    return rows
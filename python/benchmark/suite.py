@@ -0,0 +1,252 @@
+"""
+The benchmarks and the functions to run them and save the results.
+
+A benchmark is a function registered with @benchmark(name). It receives the Fixtures and returns the
+function to time, or a tuple (function, bytes processed per call) to also get a throughput figure.
+"""
+# python
+import collections
+import fnmatch
+import os
+import platform
+import sys
+import time
+
+# internal
+import shared.python.disk_usage as disk_usage
+import shared.python.file as pyfile
+import shared.python.serialize as serialize
+import shared.python.utils as pyutils
+from shared.python.benchmark import fixtures as fixtures_
+from shared.python.benchmark import measure as measure_
+
+BENCHMARKS = collections.OrderedDict()
+
+
+def benchmark(name, repeat=None):
+    """
+    Registers a benchmark.
+    Args:
+        name: (str) "<module>.<function>", used to compare results between runs
+        repeat: (int) overrides the repeat count of the run for slow benchmarks
+    """
+    def decorator(fn):
+        fn.benchmark_repeat = repeat
+        BENCHMARKS[name] = fn
+        return fn
+    return decorator
+
+
+# """ --------------------------- FILE --------------------------- """
+
+@benchmark("file.list_files")
+def _list_files(fixtures):
+    root = fixtures.tree()
+    return lambda: pyfile.list_files(root, recursive=True)
+
+
+@benchmark("file.list_files.extension")
+def _list_files_extension(fixtures):
+    root = fixtures.tree()
+    return lambda: pyfile.list_files(root, extension=["ma", "mb"], recursive=True)
+
+
+@benchmark("file.walk")
+def _walk(fixtures):
+    root = fixtures.tree()
+    return lambda: pyfile.walk(root)
+
+
+@benchmark("file.walk.trie")
+def _walk_trie(fixtures):
+    root = fixtures.tree()
+    return lambda: pyfile.walk(root, as_trie=True)
+
+
+@benchmark("file.get_disk_size")
+def _get_disk_size(fixtures):
+    root = fixtures.tree()
+    return lambda: pyfile.get_disk_size(root)
+
+
+@benchmark("disk_usage.analyze")
+def _disk_usage_analyze(fixtures):
+    root = fixtures.tree()
+    return lambda: disk_usage.analyze(root)
+
+
+@benchmark("disk_usage.analyze.cached")
+def _disk_usage_analyze_cached(fixtures):
+    root = fixtures.tree()
+    cache_path = fixtures.path("disk_usage.json")
+    # folders modified within seconds of a scan are always scanned again, age the fresh fixtures
+    old = time.time() - 3600
+    for dir_path, dir_names, file_names in os.walk(root):
+        os.utime(dir_path, (old, old))
+    disk_usage.analyze(root, cache_path=cache_path)
+    return lambda: disk_usage.analyze(root, cache_path=cache_path)
+
+
+@benchmark("file.hash_file", repeat=3)
+def _hash_file(fixtures):
+    path = fixtures.big_file(fixtures.settings["hash_file_size"])
+    return lambda: pyfile.hash_file(path), os.path.getsize(path)
+
+
+@benchmark("file.hash_file.buffered", repeat=3)
+def _hash_file_buffered(fixtures):
+    path = fixtures.big_file(fixtures.settings["hash_file_size"])
+    return lambda: pyfile.hash_file(path, use_mmap=False), os.path.getsize(path)
+
+
+@benchmark("file.hash_files")
+def _hash_files(fixtures):
+    paths = pyfile.walk(fixtures.tree())
+    return lambda: pyfile.hash_files(paths), sum(os.path.getsize(p) for p in paths)
+
+
+@benchmark("file.hash_files.cached")
+def _hash_files_cached(fixtures):
+    paths = pyfile.walk(fixtures.tree())
+    cache = pyfile.HashCache()
+    pyfile.hash_files(paths, cache=cache)
+    return lambda: pyfile.hash_files(paths, cache=cache), sum(os.path.getsize(p) for p in paths)
+
+
+# """ ------------------------ SERIALIZE ------------------------- """
+
+@benchmark("serialize.load")
+def _serialize_load(fixtures):
+    path = fixtures.json_file()
+    return lambda: serialize.load(path), os.path.getsize(path)
+
+
+@benchmark("serialize.save")
+def _serialize_save(fixtures):
+    document = fixtures.json_document()
+    path = fixtures.path("save_target.json")
+    return lambda: serialize.save(path, document)
+
+
+# """ -------------------------- UTILS --------------------------- """
+
+@benchmark("utils.deep_compare")
+def _deep_compare(fixtures):
+    document = fixtures.json_document()
+    other = serialize.load(fixtures.json_file(), normalizer=pyutils.StringNormalizer())
+    return lambda: pyutils.deep_compare(document, other)
+
+
+@benchmark("utils.fingerprint")
+def _fingerprint(fixtures):
+    document = fixtures.json_document()
+    return lambda: pyutils.fingerprint(document)
+
+
+@benchmark("utils.fingerprint.tracked_edit")
+def _fingerprint_tracked_edit(fixtures):
+    document = pyutils.track(fixtures.json_document())
+    pyutils.fingerprint(document)
+    # the deepest dict of the first branch, every call edits it and hashes the document again
+    leaf = document
+    while True:
+        nested = [value for value in leaf.values() if isinstance(value, dict)]
+        if not nested:
+            break
+        leaf = nested[0]
+    
+    def edit():
+        leaf["benchmark_counter"] = leaf.get("benchmark_counter", 0) + 1
+        return pyutils.fingerprint(document)
+    return edit
+
+
+@benchmark("utils.get_sorted_by_most_common", repeat=3)
+def _get_sorted_by_most_common(fixtures):
+    tags = fixtures.tags()
+    return lambda: pyutils.get_sorted_by_most_common(tags)
+
+
+def run_benchmarks(names=None, scale="small", warmup=1, repeat=5, fixtures=None, log=None):
+    """
+    Args:
+        names:
+            (list) glob patterns of the benchmarks to run (example: ["file.*"]), all of them by default
+        scale:
+            (str) small, medium or large, the size of the generated fixtures
+        warmup:
+            (int) untimed calls before timing
+        repeat:
+            (int) timings per benchmark
+        fixtures:
+            (Fixtures) reuse fixtures, they are generated in a temp folder and removed otherwise
+        log:
+            fn(str) called with a line per benchmark, print for example
+
+    Returns:
+        (dict) {"meta": {...}, "results": {name: measure() result}}
+    """
+    patterns = pyutils.make_list(names) or ["*"]
+    own_fixtures = fixtures is None
+    fixtures = fixtures or fixtures_.Fixtures(scale=scale)
+
+    results = dict()
+    try:
+        for name, fn in BENCHMARKS.items():
+            if not any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+                continue
+
+            prepared = fn(fixtures)
+            work = None
+            if isinstance(prepared, tuple):
+                prepared, work = prepared
+
+            results[name] = measure_.measure(prepared, warmup=warmup, repeat=fn.benchmark_repeat or repeat,
+                                             work=work)
+            if log:
+                log(format_result(name, results[name]))
+    finally:
+        if own_fixtures:
+            fixtures.cleanup()
+
+    meta = {
+        "time": time.time(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "machine": platform.node(),
+        "scale": fixtures.scale,
+        "fixtures_version": fixtures_.FIXTURES_VERSION,
+        "warmup": warmup,
+        "repeat": repeat,
+    }
+    return {"meta": meta, "results": results}
+
+
+def format_result(name, result):
+    line = "{0:<40} median {1:>10.6f}s  stdev {2:>9.6f}s".format(name, result["median"], result["stdev"])
+    if result.get("peak_memory") is not None:
+        line += "  peak +{0:>8.1f}MB".format(result["peak_memory"] / 1048576.0)
+    if result.get("throughput"):
+        line += "  {0:>8.1f}MB/s".format(result["throughput"] / 1048576.0)
+    return line
+
+
+def save_results(path, results):
+    return serialize.save(path, results)
+
+
+def load_results(path):
+    results = serialize.load(path)
+    if results is None:
+        raise IOError("no benchmark results in '{0}'".format(path))
+    return results
+
+
+def format_comparison(rows):
+    lines = ["{0:<40} {1:>12} {2:>12} {3:>8} {4:>8}".format("benchmark", "baseline", "current", "time", "memory")]
+    for row in rows:
+        memory = "{0:>7.2f}x".format(row["memory_ratio"]) if row["memory_ratio"] is not None else "{0:>8}".format("-")
+        ratio = "{0:>7.2f}x".format(row["ratio"]) if row["ratio"] is not None else "{0:>8}".format("-")
+        lines.append("{0:<40} {1:>11.6f}s {2:>11.6f}s {3} {4}{5}".format(
+            row["name"], row["baseline"], row["current"], ratio, memory, "  REGRESSION" if row["regressed"] else ""))
+    return "\n".join(lines)
@@ -0,0 +1,390 @@
+"""
+Content addressable store, to keep a single copy of files that get copied to many places
+(textures, caches...).
+
+Files are added by the hash of their content and stored once under root/objects. Destinations are
+hardlinks to the stored file when they are on the same device, reflinks (copy on write clones) when the
+file system supports them, and plain copies otherwise. Every destination is recorded as a reference,
+gc() removes the objects nobody references anymore.
+
+layout:
+    root/objects/<hash[:2]>/<hash[2:4]>/<hash>
+    root/refs/<hash>/<hash of the destination path>     (contains the destination path)
+    root/tmp/
+
+example:
+    store = ContentStore(r"P:\\project\\.store")
+    store.copy(texture, shot_folder + "/textures/wood.tga")   # instead of file.copy
+    print(dedup_report(r"P:\\project\\shots"))
+"""
+# python
+import collections
+import errno
+import hashlib
+import os
+import shutil
+import stat
+import uuid
+
+# internal
+import shared.python.file as pyfile
+
+LINK = "link"
+REFLINK = "reflink"
+COPY = "copy"
+
+# linux ioctl to clone a file on copy on write file systems (btrfs, xfs)
+_FICLONE = 0x40049409
+
+
+def _reflink(src, dst):
+    """ returns False if the file system can't clone files """
+    try:
+        import fcntl
+    except ImportError:
+        return False
+
+    with open(src, "rb") as src_file:
+        with open(dst, "wb") as dst_file:
+            try:
+                fcntl.ioctl(dst_file.fileno(), _FICLONE, src_file.fileno())
+            except (IOError, OSError):
+                failed = True
+            else:
+                failed = False
+    if failed:
+        os.remove(dst)
+    return not failed
+
+
+def _copy_hashed(src, dst, algorithm):
+    """ copies 'src' to 'dst' and returns the hash of the bytes that were written, the source is read once """
+    hasher = hashlib.new(algorithm)
+    buffer_ = bytearray(pyfile.HASH_CHUNK_SIZE)
+    view = memoryview(buffer_)
+    with open(src, "rb") as src_file:
+        with open(dst, "wb") as dst_file:
+            while True:
+                read = src_file.readinto(buffer_)
+                if not read:
+                    break
+                hasher.update(view[:read])
+                dst_file.write(view[:read])
+    shutil.copystat(src, dst)
+    return hasher.hexdigest()
+
+
+def _unlink(path):
+    # chmod only when needed: on a hardlink it would also change the stored object
+    try:
+        os.remove(path)
+    except OSError:
+        os.chmod(path, stat.S_IWRITE)
+        os.remove(path)
+
+
+class ContentStore(object):
+    """
+    Args:
+        root:
+            (str) folder of the store. For hardlinks to work it has to be on the same device as the destinations.
+        algorithm:
+            (str) any hashlib algorithm
+        modes:
+            (list) how destinations are made, in order of preference: "link", "reflink", "copy"
+        cache:
+            (file.HashCache) skips hashing files that were already added and did not change since
+    """
+
+    def __init__(self, root, algorithm="sha1", modes=(LINK, REFLINK, COPY), cache=None):
+        self.root = pyfile.expandnorm(root)
+        self.algorithm = algorithm
+        self.modes = tuple(modes)
+        self.cache = cache
+        for folder in ("objects", "refs", "tmp"):
+            pyfile.mkdir(os.path.join(self.root, folder))
+
+    def object_path(self, digest):
+        return os.path.join(self.root, "objects", digest[:2], digest[2:4], digest)
+
+    def _refs_dir(self, digest):
+        return os.path.join(self.root, "refs", digest)
+
+    def _tmp_path(self, directory=None):
+        return os.path.join(directory or os.path.join(self.root, "tmp"), ".store-{0}.tmp".format(uuid.uuid4().hex))
+
+    def __contains__(self, digest):
+        return os.path.isfile(self.object_path(digest))
+
+    def hash(self, path):
+        return pyfile.hash_file(path, self.algorithm, cache=self.cache)
+
+    def add(self, path, digest=None):
+        """
+        Stores the content of 'path', once.
+        Args:
+            path: (str) file to add
+            digest: (str) hash of the file if it is already known, saves hashing it when it is already stored
+        Returns:
+            (str) the hash of the content. When the file is copied into the store, the hash of the copy,
+            which differs from 'digest' if the file changed since it was hashed.
+        """
+        path = pyfile.expand(path)
+        if digest is None:
+            digest = self.hash(path)
+        if os.path.isfile(self.object_path(digest)):
+            return digest
+
+        # always a copy, a hardlink to the source would change along with it. The copy is hashed while it
+        # is written and stored under that hash, the source may have changed since 'digest' was computed.
+        tmp_path = self._tmp_path()
+        digest = _copy_hashed(path, tmp_path, self.algorithm)
+        object_path = self.object_path(digest)
+        if os.path.isfile(object_path):
+            os.remove(tmp_path)
+            return digest
+        pyfile.mkdir(os.path.dirname(object_path))
+
+        # stored content is shared by every destination, it must never be edited in place
+        os.chmod(tmp_path, stat.S_IREAD | stat.S_IRGRP | stat.S_IROTH)
+        try:
+            os.rename(tmp_path, object_path)
+        except OSError:
+            # another process stored the same content first (windows can't rename over a file)
+            os.remove(tmp_path)
+            if not os.path.isfile(object_path):
+                raise
+        return digest
+
+    def materialize(self, digest, dst, modes=None):
+        """
+        Makes 'dst' a file with the content 'digest', replacing what was there.
+        Args:
+            digest: (str) hash returned by add()
+            dst: (str) destination path
+            modes: (list) overrides the modes of the store for this call
+        Returns:
+            (str) the mode that was used: "link", "reflink" or "copy"
+        """
+        object_path = self.object_path(digest)
+        if not os.path.isfile(object_path):
+            raise IOError(errno.ENOENT, "'{0}' is not in the store".format(digest), object_path)
+
+        dst = pyfile.expandnorm(dst)
+        pyfile.mkdir(os.path.dirname(dst))
+        tmp_path = self._tmp_path(os.path.dirname(dst))
+
+        used = None
+        for mode in modes or self.modes:
+            if mode == LINK:
+                try:
+                    os.link(object_path, tmp_path)
+                except OSError:
+                    continue
+            elif mode == REFLINK:
+                if not _reflink(object_path, tmp_path):
+                    continue
+            elif mode == COPY:
+                shutil.copyfile(object_path, tmp_path)
+                shutil.copystat(object_path, tmp_path)
+            else:
+                raise ValueError("unknown mode: {0}".format(mode))
+            used = mode
+            break
+
+        if used is None:
+            raise IOError("could not materialize '{0}' to '{1}' with modes {2}".format(digest, dst, modes or self.modes))
+
+        if os.name == "nt" and os.path.exists(dst):
+            _unlink(dst)
+        os.rename(tmp_path, dst)
+        self._add_ref(digest, dst)
+        return used
+
+    def copy(self, src, dst):
+        """
+        Drop in for file.copy of a single file: stores src and materializes it at dst.
+        Returns:
+            (str) the hash of the content
+        """
+        digest = self.add(src)
+        self.materialize(digest, dst)
+        return digest
+
+    # """ -------------------------- REFS --------------------------- """
+
+    def _ref_path(self, digest, dst):
+        key = hashlib.sha1(os.path.normcase(os.path.abspath(dst))).hexdigest()
+        return os.path.join(self._refs_dir(digest), key)
+
+    def _add_ref(self, digest, dst):
+        # one file per reference, adding or removing one never needs a lock
+        ref_path = self._ref_path(digest, dst)
+        pyfile.mkdir(os.path.dirname(ref_path))
+        with open(ref_path, "w") as f:
+            f.write(dst)
+
+    def release(self, digest, dst, delete=False):
+        """
+        Drops the reference of 'dst' to 'digest'.
+        Args:
+            delete: (bool) also delete the destination file
+        """
+        try:
+            os.remove(self._ref_path(digest, dst))
+        except OSError:
+            pass
+        if delete and os.path.isfile(dst):
+            _unlink(dst)
+            object_path = self.object_path(digest)
+            if os.name == "nt" and os.path.isfile(object_path):
+                # hardlinks share their attributes on windows, the stored object has to stay read only
+                os.chmod(object_path, stat.S_IREAD)
+
+    def refs(self, digest):
+        """ Returns: (list) the destination paths that reference 'digest' """
+        refs_dir = self._refs_dir(digest)
+        try:
+            names = os.listdir(refs_dir)
+        except OSError:
+            return list()
+
+        paths = list()
+        for name in names:
+            try:
+                with open(os.path.join(refs_dir, name)) as f:
+                    paths.append(f.read())
+            except IOError:
+                pass
+        return paths
+
+    def ref_count(self, digest):
+        try:
+            return len(os.listdir(self._refs_dir(digest)))
+        except OSError:
+            return 0
+
+    def digests(self):
+        """ Yields the hash of every stored object """
+        objects = os.path.join(self.root, "objects")
+        for dir_path, dir_names, file_names in os.walk(objects):
+            for file_name in file_names:
+                yield file_name
+
+    def _is_ref_valid(self, digest, dst):
+        try:
+            dst_stat = os.stat(dst)
+        except OSError:
+            return False
+        object_stat = os.stat(self.object_path(digest))
+        if dst_stat.st_ino == object_stat.st_ino and dst_stat.st_dev == object_stat.st_dev:
+            return True
+        # copies and reflinks: the destination still has the stored content, unless it was edited since
+        if dst_stat.st_size != object_stat.st_size:
+            return False
+        return dst_stat.st_mtime == object_stat.st_mtime or self.hash(dst) == digest
+
+    def gc(self, verify=True, dry_run=False):
+        """
+        Removes the stored objects that have no references left.
+        Args:
+            verify: (bool) first drop the references whose destination was deleted or overwritten
+            dry_run: (bool) only report
+        Returns:
+            (dict) removed: list of hashes, freed: bytes, dropped_refs: number of references dropped
+        """
+        removed = list()
+        freed = 0
+        dropped_refs = 0
+        for digest in list(self.digests()):
+            refs = self.refs(digest)
+            if verify:
+                valid = [dst for dst in refs if self._is_ref_valid(digest, dst)]
+                dropped_refs += len(refs) - len(valid)
+                if not dry_run:
+                    for dst in refs:
+                        if dst not in valid:
+                            self.release(digest, dst)
+                refs = valid
+            if refs:
+                continue
+
+            object_path = self.object_path(digest)
+            freed += os.path.getsize(object_path)
+            removed.append(digest)
+            if not dry_run:
+                pyfile.remove(object_path, force=True)
+                shutil.rmtree(self._refs_dir(digest), ignore_errors=True)
+
+        return {"removed": removed, "freed": freed, "dropped_refs": dropped_refs}
+
+    def stats(self):
+        """ Returns: (dict) objects: how many, size: bytes stored, refs: references """
+        objects = 0
+        size = 0
+        refs = 0
+        for digest in self.digests():
+            objects += 1
+            size += os.path.getsize(self.object_path(digest))
+            refs += self.ref_count(digest)
+        return {"objects": objects, "size": size, "refs": refs}
+
+
+def dedup_report(root, algorithm="sha1", min_size=1, cache=None):
+    """
+    Finds the files with the same content under 'root'.
+    Only files that have the same size as another file are hashed, and files that are already hardlinks
+    of each other count as one.
+
+    Args:
+        root: (str) folder to scan
+        algorithm: (str) hashlib algorithm
+        min_size: (int) ignore files smaller than this many bytes
+        cache: (file.HashCache) reuse the hashes of files that did not change since the last report
+
+    Returns:
+        (dict)
+            groups: list of lists of paths with the same content, biggest waste first
+            files: number of files scanned
+            duplicates: number of files that could be replaced by a link
+            wasted: bytes used by the duplicates
+    """
+    by_size = collections.defaultdict(dict)
+    scanned = 0
+    for dir_path, dir_names, file_names in os.walk(pyfile.expand(root)):
+        for file_name in file_names:
+            path = os.path.join(dir_path, file_name)
+            try:
+                file_stat = os.lstat(path)
+            except OSError:
+                continue
+            if not stat.S_ISREG(file_stat.st_mode) or file_stat.st_size < min_size:
+                continue
+            scanned += 1
+            # one entry per inode, hardlinks already share their blocks
+            by_size[file_stat.st_size].setdefault((file_stat.st_dev, file_stat.st_ino), path)
+
+    candidates = list()
+    for inodes in by_size.values():
+        if len(inodes) > 1:
+            candidates.extend(inodes.values())
+    digests = pyfile.hash_files(candidates, algorithm=algorithm, cache=cache, errors="ignore")
+
+    groups = list()
+    duplicates = 0
+    wasted = 0
+    for size, inodes in by_size.items():
+        if len(inodes) < 2:
+            continue
+        by_hash = collections.defaultdict(list)
+        for path in inodes.values():
+            if digests.get(path):
+                by_hash[digests[path]].append(path)
+        for paths in by_hash.values():
+            if len(paths) > 1:
+                groups.append((size * (len(paths) - 1), sorted(paths)))
+                duplicates += len(paths) - 1
+                wasted += size * (len(paths) - 1)
+
+    groups.sort(reverse=True)
+    return {"groups": [paths for _, paths in groups], "files": scanned, "duplicates": duplicates, "wasted": wasted}
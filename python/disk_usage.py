@@ -0,0 +1,280 @@
+"""
+Disk usage of big folder trees, for quota reports.
+
+Unlike file.get_disk_size, analyze():
+    - counts the blocks allocated on disk (st_blocks) instead of the apparent size of the files, the
+      folders included like du does
+    - counts hardlinked files once, the first time their inode is seen
+    (with blocks=False it counts the apparent size of the files like file.get_disk_size, the same total)
+    - breaks the total down per folder and keeps the largest files and folders
+    - can save what it found per folder in a cache. The next run only lists again the folders whose
+      mtime changed and reuses the rest.
+
+The mtime of a folder only changes when files are added, removed or renamed in it. A file that grows in
+place (a log, a cache written over) is not seen until something else changes in its folder, pass
+full=True once in a while to rescan everything.
+
+example:
+    usage = analyze(r"P:\\project", cache_path=r"P:\\project\\.disk_usage.json")
+    print(usage.size, usage.files)
+    for size, path in usage.top_files:
+        print(size, path)
+    print(usage.children("shots"))
+"""
+# python
+import heapq
+import os
+import stat
+import time
+
+# internal
+import shared.python.file as pyfile
+import shared.python.serialize as serialize
+import shared.python.utils as pyutils
+
+CACHE_VERSION = 2
+
+# folders modified this close to the previous scan could change again within the same mtime tick
+_RACY_SECONDS = 2.0
+
+# indices of a cached folder entry:
+# [mtime, device, files, apparent size, allocated size, [[size, name]], [[name, inode, apparent, allocated]],
+#  [sub folder names]]
+# files and sizes only count the files that are not hardlinked, the hardlinked ones are listed with their
+# inode so they can be counted once across the whole tree.
+MTIME = 0
+DEVICE = 1
+FILES = 2
+APPARENT = 3
+ALLOCATED = 4
+TOP = 5
+LINKS = 6
+SUB_DIRS = 7
+
+
+def _allocated(file_stat):
+    blocks = getattr(file_stat, "st_blocks", None)
+    if blocks is None:
+        # windows: no block count, the apparent size is the best there is
+        return file_stat.st_size
+    return blocks * 512
+
+
+def _push(heap, size, item, count):
+    """ keeps the 'count' largest (size, item) in 'heap' """
+    if len(heap) < count:
+        heapq.heappush(heap, (size, item))
+    elif heap and size > heap[0][0]:
+        heapq.heappushpop(heap, (size, item))
+
+
+class DiskUsage(object):
+    """
+    What analyze() found under 'root'. Sizes are allocated bytes, or apparent bytes if analyze() was
+    called with blocks=False.
+
+    directories: relative folder path ("" for the root) -> [size, total size, files, total files],
+                 the totals include the sub folders
+    top_files: list of (size, path), largest first
+    top_dirs: list of (total size, path), largest first
+    """
+
+    def __init__(self, root, directories, apparent_size, allocated_size, top_files, top_dirs, blocks=True,
+                 rescanned=0):
+        self.root = root
+        self.directories = directories
+        self.apparent_size = apparent_size
+        self.allocated_size = allocated_size
+        self.top_files = top_files
+        self.top_dirs = top_dirs
+        self.blocks = blocks
+        self.rescanned = rescanned
+
+    def __repr__(self):
+        return "<DiskUsage {0!r} {1} bytes in {2} files>".format(self.root, self.size, self.files)
+
+    @property
+    def size(self):
+        return self.allocated_size if self.blocks else self.apparent_size
+
+    @property
+    def files(self):
+        return self.directories[""][3] if "" in self.directories else 0
+
+    def _rel(self, path):
+        if os.path.isabs(path):
+            path = os.path.relpath(pyfile.expandnorm(path), self.root)
+        return "" if path == "." else path
+
+    def size_of(self, path):
+        """ Returns: (int) total size of a folder, relative to the root or absolute. None if it was not found """
+        entry = self.directories.get(self._rel(path))
+        return entry[1] if entry else None
+
+    def children(self, path=""):
+        """ Returns: (list) (total size, name) of the sub folders of 'path', largest first """
+        rel = self._rel(path)
+        found = list()
+        for sub in self.directories:
+            if sub and os.path.dirname(sub) == rel:
+                found.append((self.directories[sub][1], os.path.basename(sub)))
+        found.sort(reverse=True)
+        return found
+
+    def to_dict(self):
+        return {"root": self.root, "blocks": self.blocks, "size": self.size, "apparent_size": self.apparent_size,
+                "allocated_size": self.allocated_size, "files": self.files, "directories": self.directories,
+                "top_files": self.top_files, "top_dirs": self.top_dirs}
+
+
+def _scan_dir(path, dir_stat, top, blocks):
+    files = 0
+    if blocks:
+        # the folder itself takes blocks too, like du counts it
+        apparent = dir_stat.st_size
+        allocated = _allocated(dir_stat)
+    else:
+        # only the files, the same total as file.get_disk_size without a cache
+        apparent = allocated = 0
+    heap = list()
+    links = list()
+    sub_dirs = list()
+    try:
+        names = os.listdir(path)
+    except OSError:
+        names = list()
+
+    for name in names:
+        try:
+            file_stat = os.lstat(os.path.join(path, name))
+        except OSError:
+            continue
+        if stat.S_ISDIR(file_stat.st_mode):
+            sub_dirs.append(name)
+            continue
+        if not blocks and stat.S_ISLNK(file_stat.st_mode):
+            # os.path.getsize follows the link, os.walk lists links to folders as folders and never enters them
+            try:
+                file_stat = os.stat(os.path.join(path, name))
+            except OSError:
+                continue
+            if stat.S_ISDIR(file_stat.st_mode):
+                continue
+        file_allocated = _allocated(file_stat)
+        if blocks and file_stat.st_nlink > 1:
+            links.append([name, file_stat.st_ino, file_stat.st_size, file_allocated])
+            continue
+        files += 1
+        apparent += file_stat.st_size
+        allocated += file_allocated
+        if top:
+            _push(heap, file_allocated if blocks else file_stat.st_size, name, top)
+
+    return [dir_stat.st_mtime, dir_stat.st_dev, files, apparent, allocated, [list(item) for item in heap], links,
+            sub_dirs]
+
+
+def _load_cache(cache_path, root, top, blocks):
+    data = serialize.load(cache_path, normalizer=pyutils.StringNormalizer())
+    if (not data or data.get("version") != CACHE_VERSION or data.get("root") != root
+            or data.get("blocks") != blocks or data.get("top", 0) < top):
+        return None
+    return data
+
+
+def analyze(root, cache_path=None, top=20, blocks=True, full=False):
+    """
+    Args:
+        root:
+            (str) folder to measure
+        cache_path:
+            (str) json file to keep the result of every folder in. Folders whose mtime did not change
+            since the previous run are not listed again.
+        top:
+            (int) how many of the largest files and folders to keep
+        blocks:
+            (bool) measure allocated blocks, False for the apparent size of the files counted the same way
+            as file.get_disk_size: folders not counted, every hardlink counted, symlinks to files followed
+        full:
+            (bool) ignore the cache and list every folder, the cache is still updated
+
+    Returns:
+        (DiskUsage)
+    """
+    root = pyfile.expandnorm(root)
+    scan_time = time.time()
+    cache = _load_cache(cache_path, root, top, blocks) if cache_path and not full else None
+    previous = cache["dirs"] if cache else dict()
+    racy_limit = cache["time"] - _RACY_SECONDS if cache else 0
+
+    dirs = dict()
+    rescanned = 0
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        abs_dir = os.path.join(root, rel_dir) if rel_dir else root
+        try:
+            dir_stat = os.stat(abs_dir)
+        except OSError:
+            continue
+
+        entry = previous.get(rel_dir)
+        if entry is None or entry[MTIME] != dir_stat.st_mtime or dir_stat.st_mtime >= racy_limit:
+            entry = _scan_dir(abs_dir, dir_stat, top, blocks)
+            rescanned += 1
+        dirs[rel_dir] = entry
+        stack.extend(os.path.join(rel_dir, name) for name in entry[SUB_DIRS])
+
+    if cache_path and (rescanned or cache is None or len(dirs) != len(previous)):
+        serialize.save(cache_path, {"version": CACHE_VERSION, "root": root, "blocks": blocks, "top": top,
+                                    "time": scan_time, "dirs": dirs}, indent=None, sort_keys=False)
+    return _summarize(root, dirs, top, blocks, rescanned)
+
+
+def _summarize(root, dirs, top, blocks, rescanned):
+    seen = set()
+    directories = dict()
+    file_heap = list()
+    apparent_size = 0
+    allocated_size = 0
+
+    # sorted so a hardlinked file is always counted in the same folder
+    for rel_dir in sorted(dirs):
+        entry = dirs[rel_dir]
+        files = entry[FILES]
+        apparent = entry[APPARENT]
+        allocated = entry[ALLOCATED]
+        for name, inode, link_apparent, link_allocated in entry[LINKS]:
+            key = (entry[DEVICE], inode)
+            if key in seen:
+                continue
+            seen.add(key)
+            files += 1
+            apparent += link_apparent
+            allocated += link_allocated
+            if top:
+                _push(file_heap, link_allocated if blocks else link_apparent, os.path.join(root, rel_dir, name), top)
+        if top:
+            for size, name in entry[TOP]:
+                _push(file_heap, size, os.path.join(root, rel_dir, name), top)
+
+        apparent_size += apparent
+        allocated_size += allocated
+        size = allocated if blocks else apparent
+        directories[rel_dir] = [size, size, files, files]
+
+    # deepest folders first, each one adds its totals to its parent
+    for rel_dir in sorted(directories, key=lambda path: path.count(os.sep) if path else -1, reverse=True):
+        if not rel_dir:
+            continue
+        parent = directories.get(os.path.dirname(rel_dir))
+        if parent is not None:
+            entry = directories[rel_dir]
+            parent[1] += entry[1]
+            parent[3] += entry[3]
+
+    top_dirs = heapq.nlargest(top, ((entry[1], os.path.join(root, rel_dir) if rel_dir else root)
+                                    for rel_dir, entry in directories.iteritems())) if top else list()
+    top_files = sorted(file_heap, reverse=True)
+    return DiskUsage(root, directories, apparent_size, allocated_size, top_files, top_dirs, blocks=blocks,
+                     rescanned=rescanned)
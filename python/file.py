@@ -6,16 +6,28 @@ Has lots of helper functions to deal with path normalization, directory structur
 import os
 import shutil
 import stat
-import tempfile
 import time
+import threading
 import contextlib
-from filecmp import dircmp
 
 # internal
-import shared.python.utils as pyutils
+from shared.python.imports import lazy_import
+
+# heavier dependencies are only imported by the functions that use them
+tempfile = lazy_import("tempfile")
+filecmp = lazy_import("filecmp")
+pyutils = lazy_import("shared.python.utils")
+serialize = lazy_import("shared.python.serialize")
+hashlib = lazy_import("hashlib")
+mmap = lazy_import("mmap")
+multiprocessing = lazy_import("multiprocessing")
+transfer = lazy_import("shared.python.transfer")
+path_trie = lazy_import("shared.python.path_trie")
+disk_usage = lazy_import("shared.python.disk_usage")
+Queue = lazy_import("Queue")
 
 # external
-import lockfile
+lockfile = lazy_import("lockfile")
 
 rmtree = shutil.rmtree
 normalize = os.path.normpath
@@ -176,10 +188,17 @@ def upper_letter_drive(file_path):
     return file_path
 
 
-def get_disk_size(start_path='.'):
+def get_disk_size(start_path='.', blocks=False, cache_path=None):
     """
     returns the total size on disk of a given folder
+    
+    blocks(bool) - count the blocks allocated on disk and hardlinked files once, see disk_usage.analyze
+    cache_path(str) - reuse the sizes of the folders that did not change since the last call,
+                      see disk_usage.analyze. The total is the same as without a cache.
     """
+    if blocks or cache_path:
+        return disk_usage.analyze(start_path, cache_path=cache_path, top=0, blocks=blocks).size
+    
     folder_size = 0
     for dir_path, dir_names, file_names in os.walk(start_path):
         for f in file_names:
@@ -189,7 +208,7 @@ def get_disk_size(start_path='.'):
 
 
 def get_tree_differences(path1, path2):
-    dcmp = dircmp(path1, path2)
+    dcmp = filecmp.dircmp(path1, path2)
     diffs = _gather_differences_in_paths(dcmp)
     return diffs
 
@@ -273,10 +292,13 @@ def delete(path, force=False):
                 os.remove(expand(p))
 
 
-def copy(src, dst):
+def copy(src, dst, resumable=False, **options):
     """
     If the source is a folder, it will copy the contentes of the folder.
     Otherwise, Windows will error out due to permissions problems.
+    
+    resumable(bool) - copy through transfer.copy: in chunks that survive an interrupted copy, with an
+                      optional bandwidth cap and progress callback. 'options' are passed to transfer.Transfer.
     """
     dst = expand(dst)
     mkdir(dirname(dst))
@@ -287,13 +309,22 @@ def copy(src, dst):
         src = [src]
     
     for s in src:
-        shutil.copyfile(expand(s), dst)
+        if resumable:
+            transfer.copy(expand(s), dst, **options)
+        else:
+            shutil.copyfile(expand(s), dst)
 
 
-def move(src, dst):
+def move(src, dst, resumable=False, **options):
+    """
+    resumable(bool) - moves across devices through transfer.move, see copy()
+    """
     dst = expand(dst)
     mkdir(dirname(dst))
-    shutil.move(expand(src), dst)
+    if resumable:
+        transfer.move(expand(src), dst, **options)
+    else:
+        shutil.move(expand(src), dst)
     return dst
 
 
@@ -326,8 +357,17 @@ def is_abs(path):
     return os.path.isabs(path)
 
 
-def walk(dir_, ext=None):
+def walk(dir_, ext=None, as_trie=False):
+    """
+    as_trie(bool) - return a path_trie.PathTrie instead of a list, far smaller for millions of files
+    """
     expanded_dir = expand(dir_)
+    if as_trie:
+        found = path_trie.PathTrie()
+        for root, dirs, files in os.walk(expanded_dir):
+            found.add_files(root, [f for f in files if f.endswith(ext)] if ext else files)
+        return found
+    
     found = []
     for root, dirs, files in os.walk(expanded_dir):
         for file in files:
@@ -388,7 +428,7 @@ def list_folders(dir_, fullpath=True, recursive=False):
     return f
 
 
-def list_files(dir_, extension=None, recursive=False):
+def list_files(dir_, extension=None, recursive=False, as_trie=False):
     """
     will return a list of files in a folder.
     By default its NOT recursive and will only return the file contents of the base dir_
@@ -396,8 +436,12 @@ def list_files(dir_, extension=None, recursive=False):
     extension can be a list (example: ["ma","mb"])
     return example: ["M:\\shared_metadata\\pickertest.ma", "M:\\shared_metadata\\pickertest2.mb"]
     
+    as_trie(bool) - return a path_trie.PathTrie instead of a list, far smaller for millions of files
     """
     
+    if as_trie:
+        return _list_files_trie(dir_, extension, recursive)
+    
     files = list()
     
     paths = pyutils.make_list(dir_)
@@ -433,6 +477,19 @@ def list_files(dir_, extension=None, recursive=False):
     return files
 
 
+def _list_files_trie(dir_, extension=None, recursive=False):
+    extensions = tuple(pyutils.make_list(extension)) if extension else None
+    files = path_trie.PathTrie()
+    for path in pyutils.make_list(dir_):
+        for (dirpath, dirnames, filenames) in os.walk(expand(path)):
+            if extensions:
+                filenames = [f for f in filenames if f.endswith(extensions)]
+            files.add_files(dirpath, filenames)
+            if not recursive:
+                break
+    return files
+
+
 def is_writable(path):
     real_path = expand(path)
     if exists(real_path):
@@ -455,14 +512,15 @@ def mkdir(dirnames):
 def temp_file_path(ext="tmp", name="temp", folder=None, dir_=None):
     """
     Returns a path to a temporary file that you can use for whatever.
-    the temp file defaults to %TEMP% directiory.
+    the temp file defaults to %TEMP% directiory (or the system temp folder where TEMP is not set).
+    The file is never cleaned up, use shared.python.scratch for temp files that are removed automatically.
     
     ext(str) - the extension of the temp file
     name(str) - the base name of the file
     folder(str) - a subfolder to put the temp file in
     dir_(str) - if this is set, the temp file goes here rather than %TEMP%
     """
-    base_dir = os.environ['TEMP']
+    base_dir = os.environ.get('TEMP') or tempfile.gettempdir()
     if dir_:
         base_dir = expand(dir_)
     
@@ -520,17 +578,27 @@ def nuke_dir(dir):
     os.rmdir(dir)
 
 
-LockTimeout = lockfile.LockTimeout
-
-
-@contextlib.contextmanager
-def open_exclusive(file_path, mode, timeout=10):
+class LockTimeout(Exception):
     """
-    opens a file and locks it so other processes can't open it.
-    WARNING, the other processes must also use 'open_exclusive' for exclusivity to work
+    Raised when a lock could not be acquired in time, catch it without importing lockfile.
+    What is raised is also a lockfile.LockTimeout (see _lock_timeout), so code catching
+    lockfile.LockTimeout or lockfile.LockError keeps working.
     """
-    
-    lock = lockfile.LockFile(file_path)
+    pass
+
+
+_LOCK_TIMEOUT_TYPE = None
+
+
+def _lock_timeout(error):
+    """ Returns: LockTimeout that is also a lockfile.LockTimeout, the class is made once lockfile is imported """
+    global _LOCK_TIMEOUT_TYPE
+    if _LOCK_TIMEOUT_TYPE is None:
+        _LOCK_TIMEOUT_TYPE = type("LockTimeout", (LockTimeout, lockfile.LockTimeout), {"__module__": __name__})
+    return _LOCK_TIMEOUT_TYPE(*error.args)
+
+
+def _acquire(lock, timeout):
     # Try to acquire the lock a few times if there is a LockFailed Error.
     # LockFailed error is raised when the lockfile is unable to be created, which
     # can happen frequently over network drives.
@@ -539,6 +607,19 @@ def open_exclusive(file_path, mode, timeout=10):
             lock.acquire(timeout=timeout)
         except lockfile.LockFailed:
             time.sleep(.5)
+        except lockfile.LockTimeout as e:
+            raise _lock_timeout(e)
+
+
+@contextlib.contextmanager
+def open_exclusive(file_path, mode, timeout=10):
+    """
+    opens a file and locks it so other processes can't open it.
+    WARNING, the other processes must also use 'open_exclusive' for exclusivity to work
+    """
+    
+    lock = lockfile.LockFile(file_path)
+    _acquire(lock, timeout)
     
     try:
         f = open(file_path, mode=mode)
@@ -556,14 +637,7 @@ def locked(file_path, timeout=10):
     """
     
     lock = lockfile.LockFile(file_path)
-    # Try to acquire the lock a few times if there is a LockFailed Error.
-    # LockFailed error is raised when the lockfile is unable to be created, which
-    # can happen frequently over network drives.
-    for i in range(5):
-        try:
-            lock.acquire(timeout=timeout)
-        except lockfile.LockFailed:
-            time.sleep(.5)
+    _acquire(lock, timeout)
     
     try:
         yield
@@ -577,3 +651,206 @@ def break_lock(file_path):
     """
     lock = lockfile.LockFile(file_path)
     lock.break_lock()
+
+
+# """ ------------------------------------------------------------ """
+# """ ------------------------------------------------------------ """
+# """ --------------------------- HASH --------------------------- """
+# """ ------------------------------------------------------------ """
+# """ ------------------------------------------------------------ """
+
+# multiple of the mmap allocation granularity and of the usual disk block sizes
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+class HashCache(object):
+    """
+    Remembers the hashes of files so unchanged files are never hashed twice.
+    An entry is only used while the size, mtime and inode of the file are the same as when it was hashed.
+    
+    path(str) - json file the cache is loaded from and saved to. None keeps it in memory only.
+    
+    example:
+        cache = HashCache("~/.cache/texture_hashes.json")
+        hashes = hash_files(textures, cache=cache)
+        cache.save()
+    """
+    
+    def __init__(self, path=None):
+        self.path = expandnorm(os.path.expanduser(path)) if path else None
+        self._entries = None
+        self._lock = threading.Lock()
+        self._dirty = False
+    
+    def _load(self):
+        if self._entries is None:
+            entries = dict()
+            if self.path:
+                entries = serialize.load(self.path, default=dict(), normalizer=pyutils.StringNormalizer()) or dict()
+            self._entries = entries
+        return self._entries
+    
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.abspath(path))
+    
+    def get(self, path, file_stat, algorithm):
+        entry = self._load().get(self._key(path))
+        if (entry and entry[0] == file_stat.st_size and entry[1] == file_stat.st_mtime
+                and entry[2] == file_stat.st_ino):
+            return entry[3].get(algorithm)
+        return None
+    
+    def set(self, path, file_stat, digests):
+        key = self._key(path)
+        with self._lock:
+            entries = self._load()
+            entry = entries.get(key)
+            if (not entry or entry[0] != file_stat.st_size or entry[1] != file_stat.st_mtime
+                    or entry[2] != file_stat.st_ino):
+                entry = [file_stat.st_size, file_stat.st_mtime, file_stat.st_ino, dict()]
+                entries[key] = entry
+            entry[3].update(digests)
+            self._dirty = True
+    
+    def prune(self):
+        """ forgets the files that do not exist anymore """
+        with self._lock:
+            entries = self._load()
+            for key in [k for k in entries if not os.path.isfile(k)]:
+                del entries[key]
+                self._dirty = True
+    
+    def save(self):
+        if not self.path or not self._dirty:
+            return False
+        with self._lock:
+            serialize.save(self.path, self._load(), indent=None, sort_keys=False)
+            self._dirty = False
+        return True
+
+
+def _hash_open_file(f, size, hashers, use_mmap):
+    if use_mmap and size:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (EnvironmentError, ValueError):
+            mapped = None
+        
+        if mapped is not None:
+            try:
+                # buffer() slices the mapping without copying it
+                for offset in xrange(0, size, HASH_CHUNK_SIZE):
+                    chunk = buffer(mapped, offset, HASH_CHUNK_SIZE)
+                    for hasher in hashers:
+                        hasher.update(chunk)
+            finally:
+                mapped.close()
+            return
+    
+    buffer_ = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buffer_)
+    while True:
+        read = f.readinto(buffer_)
+        if not read:
+            break
+        for hasher in hashers:
+            hasher.update(view[:read])
+
+
+def hash_file(path, algorithm="sha1", cache=None, use_mmap=True):
+    """
+    Returns the hex digest of a file, reading it through mmap (or large buffers) in one pass.
+    
+    path(str) - the file to hash
+    algorithm(str or list) - any hashlib algorithm. With a list, the file is read once for all of them
+                             and a dict {algorithm: digest} is returned.
+    cache(HashCache) - reuse the hash of files that did not change since they were hashed
+    use_mmap(bool) - map the file in memory instead of reading it in chunks
+    """
+    path = expand(path)
+    algorithms = pyutils.make_list(algorithm)
+    
+    file_stat = None
+    digests = dict()
+    if cache is not None:
+        file_stat = os.stat(path)
+        for name in algorithms:
+            digest = cache.get(path, file_stat, name)
+            if digest:
+                digests[name] = digest
+    
+    missing = [name for name in algorithms if name not in digests]
+    if missing:
+        hashers = [hashlib.new(name) for name in missing]
+        with open(path, "rb") as f:
+            if file_stat is None:
+                file_stat = os.fstat(f.fileno())
+            _hash_open_file(f, file_stat.st_size, hashers, use_mmap)
+        computed = dict((name, hasher.hexdigest()) for name, hasher in zip(missing, hashers))
+        digests.update(computed)
+        if cache is not None:
+            cache.set(path, file_stat, computed)
+    
+    if isinstance(algorithm, basestring):
+        return digests[algorithm]
+    return digests
+
+
+def hash_files(paths, algorithm="sha1", cache=None, workers=None, use_mmap=True, errors="raise"):
+    """
+    Hashes many files on a pool of threads. The hashing itself releases the GIL, so the threads
+    really run in parallel, and on network drives they keep several reads in flight.
+    
+    paths(list) - the files to hash
+    algorithm(str or list) - see hash_file
+    cache(HashCache) - see hash_file. It is not saved, call cache.save() when done.
+    workers(int) - number of threads, defaults to the cpu count
+    errors(str) - "raise" or "ignore": files that can't be read get None as digest
+    
+    Returns:
+        (dict) path -> digest (or {algorithm: digest} if algorithm is a list)
+    """
+    paths = pyutils.make_list(paths)
+    
+    def _hash(path):
+        try:
+            return path, hash_file(path, algorithm=algorithm, cache=cache, use_mmap=use_mmap)
+        except EnvironmentError:
+            if errors == "raise":
+                raise
+            return path, None
+    
+    if len(paths) < 2 or workers == 1:
+        return dict(_hash(path) for path in paths)
+    
+    # plain threads, multiprocessing.pool.ThreadPool takes a tenth of a second just to shut down
+    todo = Queue.Queue()
+    for path in paths:
+        todo.put(path)
+    results = dict()
+    failures = list()
+    
+    def _worker():
+        while not failures:
+            try:
+                path = todo.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                path, digest = _hash(path)
+            except EnvironmentError as e:
+                failures.append(e)
+                return
+            results[path] = digest
+    
+    threads = [threading.Thread(target=_worker) for _ in range(min(workers or multiprocessing.cpu_count(), len(paths)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    if failures:
+        raise failures[0]
+    return results
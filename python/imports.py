@@ -0,0 +1,203 @@
+"""
+Helpers to keep the cost of importing the shared package low.
+
+lazy_import returns a stand-in module that only imports the real thing the first time one of its
+attributes is used, so heavy dependencies are paid for by the functions that need them and not by
+everything that imports a module.
+
+ImportProfiler / profile_imports report how long each module takes to import.
+
+Python 2 only, like the rest of the package: the profiler hooks __builtin__.__import__ directly, the
+python 3 names (builtins, queue) are not used anywhere in the package.
+"""
+# python
+import os
+import sys
+import timeit
+import types
+import __builtin__
+
+
+# module name -> seconds spent importing it on first use of a lazy_import stand-in
+LAZY_LOAD_TIMES = dict()
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stand-in for a module that has not been imported yet.
+    The first attribute lookup imports the real module and copies its namespace onto the stand-in,
+    so later lookups cost the same as on the real module.
+    """
+
+    def __init__(self, name):
+        super(LazyModule, self).__init__(name)
+        self.__dict__["_lazy_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            time_start = timeit.default_timer()
+            __import__(self.__name__)
+            module = sys.modules[self.__name__]
+            LAZY_LOAD_TIMES[self.__name__] = timeit.default_timer() - time_start
+            self.__dict__.update(module.__dict__)
+            self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+        self.__dict__[attr] = value
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        if self.__dict__["_lazy_module"] is None:
+            return "<lazy module '{0}' (not loaded)>".format(self.__name__)
+        return repr(self.__dict__["_lazy_module"])
+
+
+def lazy_import(name):
+    """
+    Returns a module that gets imported the first time one of its attributes is accessed.
+    If the module was already imported somewhere else, the real module is returned right away.
+
+    example:
+        lockfile = lazy_import("lockfile")
+        ...
+        lock = lockfile.LockFile(path)  # lockfile is imported here
+
+    Args:
+        name:
+            (str) full dotted name of the module
+
+    Returns:
+        (module) the real module or a LazyModule stand-in
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
+
+
+def is_loaded(module):
+    """
+    Returns False if 'module' is a lazy_import stand-in that has not been imported yet.
+    """
+    if isinstance(module, LazyModule):
+        return module.__dict__["_lazy_module"] is not None
+    return True
+
+
+class ImportProfiler(object):
+    """
+    Context manager that times every module imported while it is active.
+
+    example:
+        with ImportProfiler() as profiler:
+            import shared.python.file
+        print(profiler.format_report())
+
+    Only modules that were not in sys.modules yet are recorded, 'cumulative' includes the time spent
+    importing their own dependencies and 'self' excludes it.
+    """
+
+    def __init__(self):
+        self.results = dict()
+        self._stack = list()
+        self._original_import = None
+
+    def __enter__(self):
+        self._original_import = __builtin__.__import__
+        __builtin__.__import__ = self._import
+        return self
+
+    def __exit__(self, *args):
+        __builtin__.__import__ = self._original_import
+        self._original_import = None
+
+    def _import(self, name, *args, **kwargs):
+        if name in sys.modules or not name:
+            return self._original_import(name, *args, **kwargs)
+
+        self._stack.append(0.0)
+        time_start = timeit.default_timer()
+        try:
+            return self._original_import(name, *args, **kwargs)
+        finally:
+            elapsed = timeit.default_timer() - time_start
+            children = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+
+            # relative imports in python 2 can fail over to the absolute name, record what was loaded
+            if name in sys.modules and name not in self.results:
+                self.results[name] = {"cumulative": elapsed, "self": elapsed - children}
+
+    def report(self, sort_by="cumulative"):
+        """
+        Returns:
+            (list) of (module_name, cumulative_seconds, self_seconds) slowest first
+        """
+        rows = [(k, v["cumulative"], v["self"]) for k, v in self.results.items()]
+        index = 2 if sort_by == "self" else 1
+        return sorted(rows, key=lambda row: row[index], reverse=True)
+
+    def format_report(self, limit=None, sort_by="cumulative"):
+        lines = ["{0:>12} {1:>12}  {2}".format("cumulative", "self", "module")]
+        for module_name, cumulative, self_time in self.report(sort_by=sort_by)[:limit]:
+            lines.append("{0:>12.6f} {1:>12.6f}  {2}".format(cumulative, self_time, module_name))
+        return "\n".join(lines)
+
+
+_PROFILE_SCRIPT = """
+import json, sys
+from shared.python.imports import ImportProfiler
+with ImportProfiler() as profiler:
+    for name in sys.argv[1:]:
+        __import__(name)
+sys.stdout.write(json.dumps(profiler.report()))
+"""
+
+
+def profile_imports(module_names, fresh_process=True, python=None):
+    """
+    Measures the import cost of each module imported while importing 'module_names'.
+
+    Args:
+        module_names:
+            (str or list) modules to import, example: "shared.python.file"
+        fresh_process:
+            (bool) import in a new interpreter so the numbers are those of a cold start.
+            If False, modules that are already imported in this process will not be reported.
+        python:
+            (str) interpreter to use when fresh_process is True, defaults to the current one.
+
+    Returns:
+        (list) of (module_name, cumulative_seconds, self_seconds) slowest first
+    """
+    # imported here and not at the top, importing this module is on the path of every lazy_import
+    import json
+    import subprocess
+
+    if isinstance(module_names, basestring):
+        module_names = [module_names]
+
+    if not fresh_process:
+        with ImportProfiler() as profiler:
+            for module_name in module_names:
+                __import__(module_name)
+        return profiler.report()
+
+    command = [python or sys.executable, "-c", _PROFILE_SCRIPT] + list(module_names)
+    output = subprocess.check_output(command, env=_environment_with_sys_path())
+    return [tuple(row) for row in json.loads(output)]
+
+
+def _environment_with_sys_path():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in sys.path if p)
+    return env
@@ -0,0 +1,363 @@
+"""
+Compact collection of file paths, for listings too big to keep as a list of strings.
+
+A list of full paths repeats the same folders in every string. A PathTrie stores every path component
+once (interned) and the tree as flat arrays of integers: the parent, first child, last child and next
+sibling of every node. A million paths take a fraction of the memory of the list, and paths are only
+rebuilt as strings when iterated.
+
+example:
+    files = file.walk(r"P:\\project", as_trie=True)
+    print(len(files))
+    textures = list(files.with_extension([".tga", ".exr"]))
+    new_files = files - PathTrie.load(r"P:\\project\\.listing.json")
+    files.save(r"P:\\project\\.listing.json")
+
+Not thread safe: lookups move an internal cursor.
+"""
+# python
+import array
+import os
+import sys
+
+# internal
+import shared.python.serialize as serialize
+import shared.python.utils as pyutils
+
+TRIE_VERSION = 1
+
+_TYPECODE = "i"
+
+
+class PathTrie(object):
+    """
+    Args:
+        paths: (iterable) paths to add
+        sep: (str) separator the paths are split on and joined with
+    """
+
+    def __init__(self, paths=None, sep=os.sep):
+        self.sep = sep
+        self._names = list()
+        self._name_ids = dict()
+        # node 0 is the root, it has no name and is never a member
+        self._parent = array.array(_TYPECODE, [-1])
+        self._name = array.array(_TYPECODE, [-1])
+        self._first_child = array.array(_TYPECODE, [-1])
+        self._last_child = array.array(_TYPECODE, [-1])
+        self._next_sibling = array.array(_TYPECODE, [-1])
+        self._member = bytearray(1)
+        self._len = 0
+        self._reset_cursor()
+        if paths is not None:
+            self.update(paths)
+
+    def _reset_cursor(self):
+        # the nodes of the last path looked up, with a {name id: child} dict built on demand per level,
+        # so paths added folder after folder (os.walk order) never scan the children again
+        self._cursor = [[0, None]]
+        self._cursor_names = list()
+
+    def __len__(self):
+        return self._len
+
+    def __nonzero__(self):
+        return self._len > 0
+
+    def __repr__(self):
+        return "<PathTrie {0} paths, {1} nodes, {2} names>".format(self._len, len(self._parent), len(self._names))
+
+    def __iter__(self):
+        return self._iter_paths(0, list())
+
+    def __contains__(self, path):
+        node = self._resolve(self._split(path), create=False)
+        return node > 0 and bool(self._member[node])
+
+    def __eq__(self, other):
+        if not isinstance(other, PathTrie):
+            return NotImplemented
+        return len(self) == len(other) and not any(True for _ in self._missing_from(other))
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    # """ ------------------------- NODES --------------------------- """
+
+    def _split(self, path):
+        if os.altsep and self.sep == os.sep:
+            path = path.replace(os.altsep, self.sep)
+        parts = path.split(self.sep)
+        if len(parts) > 1 and not parts[-1]:
+            parts.pop()
+        return parts
+
+    def _name_id(self, name, create):
+        name_id = self._name_ids.get(name)
+        if name_id is None and create:
+            if type(name) is str:
+                name = intern(name)
+            name_id = len(self._names)
+            self._names.append(name)
+            self._name_ids[name] = name_id
+        return name_id
+
+    def _new_node(self, parent, name_id):
+        node = len(self._parent)
+        self._parent.append(parent)
+        self._name.append(name_id)
+        self._first_child.append(-1)
+        self._last_child.append(-1)
+        self._next_sibling.append(-1)
+        self._member.append(0)
+        last = self._last_child[parent]
+        if last == -1:
+            self._first_child[parent] = node
+        else:
+            self._next_sibling[last] = node
+        self._last_child[parent] = node
+        return node
+
+    def _children(self, node):
+        child = self._first_child[node]
+        while child != -1:
+            yield child
+            child = self._next_sibling[child]
+
+    def _resolve(self, components, create):
+        """ Returns the node of 'components', -1 if it is not in the trie and create is False """
+        cursor = self._cursor
+        names = self._cursor_names
+        common = 0
+        limit = min(len(names), len(components))
+        while common < limit and names[common] == components[common]:
+            common += 1
+        del cursor[common + 1:]
+        del names[common:]
+
+        for component in components[common:]:
+            level = cursor[-1]
+            if level[1] is None:
+                level[1] = dict((self._name[child], child) for child in self._children(level[0]))
+            name_id = self._name_id(component, create)
+            child = level[1].get(name_id, -1) if name_id is not None else -1
+            if child == -1:
+                if not create:
+                    return -1
+                child = self._new_node(level[0], name_id)
+                level[1][name_id] = child
+            cursor.append([child, None])
+            names.append(component)
+        return cursor[-1][0]
+
+    def _iter_nodes(self, node, parts):
+        """
+        Yields the nodes under 'node' depth first, in the order they were added. 'parts' is updated in
+        place to the components of the node yielded, it must start as the components of 'node'.
+        """
+        base = len(parts)
+        stack = [(self._first_child[node], base)]
+        while stack:
+            child, depth = stack.pop()
+            if child == -1:
+                continue
+            stack.append((self._next_sibling[child], depth))
+            del parts[depth:]
+            parts.append(self._names[self._name[child]])
+            yield child
+            stack.append((self._first_child[child], depth + 1))
+
+    def _iter_paths(self, node, parts, name_ids=None):
+        member = self._member
+        names = self._name
+        join = self.sep.join
+        for child in self._iter_nodes(node, parts):
+            if member[child] and (name_ids is None or names[child] in name_ids):
+                yield join(parts)
+
+    # """ ------------------------ EDITING -------------------------- """
+
+    def add(self, path):
+        node = self._resolve(self._split(path), create=True)
+        if not self._member[node]:
+            self._member[node] = 1
+            self._len += 1
+
+    def update(self, paths):
+        if isinstance(paths, basestring):
+            paths = [paths]
+        for path in paths:
+            self.add(path)
+
+    def add_files(self, directory, names):
+        """ Adds the 'names' of one folder, faster than add() for the output of os.walk """
+        components = self._split(directory)
+        self._resolve(components, create=True)
+        level = self._cursor[-1]
+        if level[1] is None:
+            level[1] = dict((self._name[child], child) for child in self._children(level[0]))
+        parent = level[0]
+        for name in names:
+            name_id = self._name_id(name, create=True)
+            node = level[1].get(name_id, -1)
+            if node == -1:
+                node = self._new_node(parent, name_id)
+                level[1][name_id] = node
+            if not self._member[node]:
+                self._member[node] = 1
+                self._len += 1
+
+    def discard(self, path):
+        """ Removes 'path' if it is there. Its node is kept, for paths added again later. """
+        node = self._resolve(self._split(path), create=False)
+        if node > 0 and self._member[node]:
+            self._member[node] = 0
+            self._len -= 1
+
+    def copy(self):
+        trie = PathTrie(sep=self.sep)
+        trie._names = list(self._names)
+        trie._name_ids = dict(self._name_ids)
+        for attr in ("_parent", "_name", "_first_child", "_last_child", "_next_sibling"):
+            setattr(trie, attr, array.array(_TYPECODE, getattr(self, attr)))
+        trie._member = bytearray(self._member)
+        trie._len = self._len
+        return trie
+
+    # """ ------------------------ QUERIES -------------------------- """
+
+    def with_prefix(self, prefix):
+        """ Yields the paths of 'prefix' and below it, a folder path for example """
+        components = self._split(prefix)
+        node = self._resolve(components, create=False)
+        if node <= 0:
+            return
+        if self._member[node]:
+            yield self.sep.join(components)
+        for path in self._iter_paths(node, list(components)):
+            yield path
+
+    def with_extension(self, extension, prefix=None):
+        """
+        Yields the paths whose file name ends with 'extension'.
+        Every distinct name is only tested once, no matter how many folders it appears in.
+        Args:
+            extension: (str or list) ".ma" or "ma", or a list of them
+            prefix: (str) only look under this folder
+        """
+        extensions = tuple("." + e.lstrip(".") for e in pyutils.make_list(extension))
+        name_ids = set(i for i, name in enumerate(self._names) if name.endswith(extensions))
+        if not name_ids:
+            return
+
+        if prefix is None:
+            node, components = 0, list()
+        else:
+            components = self._split(prefix)
+            node = self._resolve(components, create=False)
+            if node <= 0:
+                return
+        for path in self._iter_paths(node, list(components), name_ids):
+            yield path
+
+    def nbytes(self):
+        """ Returns: (int) approximate bytes used by the trie, names included """
+        size = sum(len(a) * a.itemsize for a in (self._parent, self._name, self._first_child, self._last_child,
+                                                 self._next_sibling))
+        size += len(self._member)
+        size += sum(sys.getsizeof(name) for name in self._names)
+        size += sys.getsizeof(self._names) + sys.getsizeof(self._name_ids)
+        return size
+
+    # """ --------------------- SET OPERATIONS ---------------------- """
+
+    def _matched(self, other):
+        """
+        Walks self and yields (node, parts, node of the same path in 'other' or -1).
+        Folders are matched once by name, the paths themselves are never looked up.
+        """
+        parts = list()
+        translated = dict()
+        levels = list()
+        other_node = {0: 0}
+        for node in self._iter_nodes(0, parts):
+            depth = len(parts) - 1
+            other_parent = other_node.get(self._parent[node], -1)
+            match = -1
+            if other_parent != -1:
+                if len(levels) <= depth:
+                    levels.append([None, None])
+                level = levels[depth]
+                if level[0] != other_parent:
+                    level[0] = other_parent
+                    level[1] = dict((other._name[c], c) for c in other._children(other_parent))
+                name_id = self._name[node]
+                if name_id not in translated:
+                    translated[name_id] = other._name_ids.get(self._names[name_id], -1)
+                match = level[1].get(translated[name_id], -1)
+            if self._first_child[node] != -1:
+                other_node[node] = match
+            yield node, parts, match
+
+    def _missing_from(self, other):
+        """ Yields the paths of self that are not in 'other' """
+        join = self.sep.join
+        for node, parts, match in self._matched(other):
+            if self._member[node] and (match == -1 or not other._member[match]):
+                yield join(parts)
+
+    def difference(self, other):
+        return PathTrie(self._missing_from(other), sep=self.sep)
+
+    def intersection(self, other):
+        join = self.sep.join
+        return PathTrie((join(parts) for node, parts, match in self._matched(other)
+                         if self._member[node] and match != -1 and other._member[match]), sep=self.sep)
+
+    def union(self, other):
+        trie = self.copy()
+        trie.update(other)
+        return trie
+
+    def symmetric_difference(self, other):
+        trie = self.difference(other)
+        trie.update(other._missing_from(self))
+        return trie
+
+    __sub__ = difference
+    __and__ = intersection
+    __or__ = union
+    __xor__ = symmetric_difference
+
+    # """ ----------------------- SERIALIZE ------------------------- """
+
+    def to_dict(self):
+        return {"version": TRIE_VERSION, "sep": self.sep, "names": self._names, "parent": self._parent.tolist(),
+                "name": self._name.tolist(), "members": [i for i, m in enumerate(self._member) if m]}
+
+    @classmethod
+    def from_dict(cls, data):
+        trie = cls(sep=data["sep"])
+        trie._names = [intern(name) if type(name) is str else name for name in data["names"]]
+        trie._name_ids = dict((name, i) for i, name in enumerate(trie._names))
+        # parents always come before their children, the links are rebuilt in the same order
+        for parent, name_id in zip(data["parent"][1:], data["name"][1:]):
+            trie._new_node(parent, name_id)
+        for node in data["members"]:
+            trie._member[node] = 1
+        trie._len = len(data["members"])
+        return trie
+
+    def save(self, path):
+        return serialize.save(path, self.to_dict(), indent=None, sort_keys=False)
+
+    @classmethod
+    def load(cls, path):
+        """ Returns None if there is no trie at 'path' or if it was saved by an incompatible version """
+        data = serialize.load(path, normalizer=pyutils.StringNormalizer())
+        if not data or data.get("version") != TRIE_VERSION:
+            return None
+        return cls.from_dict(data)
@@ -0,0 +1,307 @@
+"""
+Scratch space for temporary files that cleans up after itself.
+
+A ScratchSpace owns one folder on a RAM backed file system (/dev/shm) and one on disk for the
+duration of a session. Small or hot files go to RAM, large ones to disk, based on the size hint given
+when asking for a path and on the free space left. Everything is removed when the session is closed,
+when the process exits (every session, closed or not), or, if the process crashed, by the next session
+that starts on the same machine.
+
+example:
+    with ScratchSpace(quota=10 * 1024 ** 3) as scratch:
+        path = scratch.path(ext="exr", size_hint=200 * 1024 ** 2)
+        with scratch.open(ext="json") as f:
+            f.write(data)
+
+    # or the session shared by the whole process, cleaned at exit
+    path = get_scratch().path(ext="ma")
+"""
+# python
+import atexit
+import errno
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+
+# internal
+import shared.python.file as pyfile
+import shared.python.utils as pyutils
+from shared.python.imports import lazy_import
+
+pysystem = lazy_import("shared.python.system")
+
+RAM_ROOT = "/dev/shm"
+PREFIX = "shared_scratch"
+
+
+# session folders not removed yet -> pid of the process that made them, removed at exit
+_LIVE_DIRS = dict()
+_LIVE_DIRS_LOCK = threading.Lock()
+
+
+class ScratchQuotaExceeded(Exception):
+    pass
+
+
+def _free_space(path):
+    try:
+        stats = os.statvfs(path)
+    except (AttributeError, OSError):
+        return None
+    return stats.f_bavail * stats.f_frsize
+
+
+def _is_process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def reap_orphans(roots=None, prefix=PREFIX):
+    """
+    Removes the session folders left behind by processes of this machine that are not running anymore.
+    Args:
+        roots: (list) folders to look in, defaults to /dev/shm and the system temp folder
+        prefix: (str) prefix of the session folders
+    Returns:
+        (list) the folders that were removed
+    """
+    if roots is None:
+        roots = [RAM_ROOT, tempfile.gettempdir()]
+
+    host = pysystem.get_computer_name()
+    session_prefix = "{0}-{1}-".format(prefix, host)
+    removed = list()
+    for root in pyutils.make_list(roots):
+        try:
+            names = os.listdir(root)
+        except OSError:
+            continue
+        for name in names:
+            if not name.startswith(session_prefix):
+                continue
+            try:
+                pid = int(name[len(session_prefix):].split("-", 1)[0])
+            except ValueError:
+                continue
+            if pid != os.getpid() and not _is_process_alive(pid):
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+                removed.append(os.path.join(root, name))
+    return removed
+
+
+class ScratchSpace(object):
+    """
+    Args:
+        quota:
+            (int) bytes this session may use, checked when handing out paths against a running total of
+            the size hints. What is really on disk (files written past their hint or without one) is
+            measured when the total would pass the quota, and each time the number of paths handed out
+            doubled. None means no quota.
+        ram_threshold:
+            (int) files with a size hint up to this many bytes go to RAM. Files without a hint go to RAM
+            when 'hot' is True, to disk otherwise.
+        ram_reserve:
+            (int) bytes of RAM file system to always leave free
+        ram_root:
+            (str) RAM backed folder, ignored if it does not exist (windows, macos)
+        disk_root:
+            (str) defaults to the system temp folder
+        reap:
+            (bool) remove the folders of crashed sessions when this one starts
+    """
+
+    _reaped_roots = set()
+
+    def __init__(self, quota=None, ram_threshold=64 * 1024 * 1024, ram_reserve=256 * 1024 * 1024,
+                 ram_root=RAM_ROOT, disk_root=None, reap=True):
+        self.quota = quota
+        self.ram_threshold = ram_threshold
+        self.ram_reserve = ram_reserve
+
+        disk_root = pyfile.expand(disk_root) if disk_root else tempfile.gettempdir()
+        if not ram_root or not os.path.isdir(ram_root) or not os.access(ram_root, os.W_OK):
+            ram_root = None
+
+        roots = [r for r in (ram_root, disk_root) if r]
+        if reap:
+            new_roots = [r for r in roots if r not in ScratchSpace._reaped_roots]
+            if new_roots:
+                reap_orphans(new_roots)
+                ScratchSpace._reaped_roots.update(new_roots)
+
+        session = "{0}-{1}-{2}-{3}".format(PREFIX, pysystem.get_computer_name(), os.getpid(),
+                                           os.urandom(4).encode("hex"))
+        self.disk_dir = os.path.join(disk_root, session)
+        self.ram_dir = os.path.join(ram_root, session) if ram_root else None
+        for folder in (self.disk_dir, self.ram_dir):
+            if folder:
+                os.makedirs(folder)
+                with _LIVE_DIRS_LOCK:
+                    _LIVE_DIRS[folder] = os.getpid()
+
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._reserved = dict()
+        self._reserved_total = 0
+        # bytes on disk past the size hints, and how many paths there were, at the last measure
+        self._measured_extra = 0
+        self._measured_paths = 0
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    @property
+    def reserved(self):
+        """ (int) sum of the size hints of the paths handed out and not released """
+        return self._reserved_total
+
+    def usage(self):
+        """ Returns: (int) bytes used by the files of this session right now """
+        return sum(pyfile.get_disk_size(folder) for folder in (self.ram_dir, self.disk_dir) if folder)
+
+    def _measure_quota(self):
+        """
+        Returns: (int) bytes counted against the quota, the size hint or the size on disk of every path.
+        Stats every path, path() only calls it when the running total is not enough to decide.
+        """
+        used = 0
+        for path, size_hint in self._reserved.items():
+            try:
+                size = pyfile.get_disk_size(path) if os.path.isdir(path) else os.path.getsize(path)
+            except OSError:
+                size = 0
+            used += max(size, size_hint)
+        self._measured_extra = used - self._reserved_total
+        self._measured_paths = len(self._reserved)
+        return used
+
+    def _pick_dir(self, size_hint, hot):
+        if not self.ram_dir:
+            return self.disk_dir
+
+        if size_hint is None:
+            if not hot:
+                return self.disk_dir
+            size_hint = 0
+        elif size_hint > self.ram_threshold:
+            return self.disk_dir
+
+        free = _free_space(self.ram_dir)
+        if free is None or free - size_hint < self.ram_reserve:
+            return self.disk_dir
+        return self.ram_dir
+
+    def path(self, ext="tmp", name="temp", size_hint=None, hot=False, folder=None):
+        """
+        Returns a path nobody else uses, the file itself is not created.
+        Args:
+            ext: (str) extension of the file
+            name: (str) base name of the file
+            size_hint: (int) expected size in bytes, used to pick RAM or disk and counted against the quota
+            hot: (bool) prefer RAM for files without a size hint
+            folder: (str) sub folder of the session folder to put the file in
+        Returns:
+            (str)
+        """
+        if self._closed:
+            raise ValueError("scratch space is closed")
+
+        with self._lock:
+            if self.quota is not None:
+                used = self._reserved_total + self._measured_extra
+                # measuring again once the paths doubled keeps the cost of the measures linear overall
+                if used + (size_hint or 0) > self.quota or len(self._reserved) >= 2 * self._measured_paths:
+                    used = self._measure_quota()
+                if used + (size_hint or 0) > self.quota:
+                    raise ScratchQuotaExceeded("{0} bytes requested, {1} of {2} bytes used".format(
+                        size_hint or 0, used, self.quota))
+            index = next(self._counter)
+            directory = self._pick_dir(size_hint, hot)
+            if ext and not ext.startswith("."):
+                ext = "." + ext
+            path = os.path.join(directory, folder or "", "{0}_{1}{2}".format(name, index, ext))
+            if size_hint or self.quota is not None:
+                self._reserved[path] = size_hint or 0
+                self._reserved_total += size_hint or 0
+
+        if folder:
+            pyfile.mkdir(os.path.dirname(path))
+        return path
+
+    def make_dir(self, name="temp", size_hint=None, hot=False):
+        """ Same as path() but creates and returns a folder """
+        path = self.path(ext="", name=name, size_hint=size_hint, hot=hot)
+        os.mkdir(path)
+        return path
+
+    def open(self, mode="w+b", ext="tmp", name="temp", size_hint=None, hot=False, folder=None):
+        """ Returns a file object opened on a new path() """
+        return open(self.path(ext=ext, name=name, size_hint=size_hint, hot=hot, folder=folder), mode)
+
+    def release(self, path):
+        """ Deletes a file or folder of this session early and frees its size hint from the quota """
+        with self._lock:
+            self._reserved_total -= self._reserved.pop(path, 0)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def close(self):
+        """ Deletes everything in the session """
+        if self._closed:
+            return
+        self._closed = True
+        for folder in (self.ram_dir, self.disk_dir):
+            if folder:
+                shutil.rmtree(folder, ignore_errors=True)
+                with _LIVE_DIRS_LOCK:
+                    _LIVE_DIRS.pop(folder, None)
+        self._reserved.clear()
+        self._reserved_total = 0
+        self._measured_extra = 0
+        self._measured_paths = 0
+
+
+_DEFAULT = dict()
+_DEFAULT_LOCK = threading.Lock()
+
+
+def get_scratch():
+    """
+    Returns the ScratchSpace shared by the whole process, created the first time and removed at exit.
+    """
+    with _DEFAULT_LOCK:
+        scratch = _DEFAULT.get("scratch")
+        if scratch is None or scratch.closed:
+            scratch = ScratchSpace()
+            _DEFAULT["scratch"] = scratch
+    return scratch
+
+
+def _remove_live_dirs():
+    """ removes the folders of every session that was not closed, even the ones nothing refers to anymore """
+    pid = os.getpid()
+    with _LIVE_DIRS_LOCK:
+        # a forked child exiting must not remove the folders of its parent
+        folders = [folder for folder, owner in _LIVE_DIRS.items() if owner == pid]
+        for folder in folders:
+            del _LIVE_DIRS[folder]
+    for folder in folders:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+atexit.register(_remove_live_dirs)
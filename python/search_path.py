@@ -0,0 +1,180 @@
+"""
+Resolves tool, plugin and script names against search path environment variables such as
+PATH, PYTHONPATH or MAYA_SCRIPT_PATH.
+
+Instead of probing every directory on every lookup, SearchPath lists the directories once and keeps
+a name -> path index. The index is rebuilt when the environment variable changes or when one of its
+directories is modified.
+
+example:
+    scripts = SearchPath("MAYA_SCRIPT_PATH")
+    path = scripts.resolve("myTool", extensions=[".mel", ".py"])
+"""
+# python
+import fnmatch
+import os
+import time
+
+# internal
+import shared.python.file as pyfile
+import shared.python.utils as pyutils
+
+
+class SearchPath(object):
+    """
+    Name -> path index over the directories of an environment variable.
+    When a name exists in more than one directory, the first directory in the variable wins.
+
+    Args:
+        env_var:
+            (str) name of the environment variable. A missing variable is treated as empty.
+        separator:
+            (str) separator between the directories, defaults to os.pathsep
+        check_interval:
+            (float) minimum number of seconds between two checks of the directory modification times.
+            The environment variable itself is compared on every lookup.
+            0 checks the directories on every lookup.
+        case_sensitive:
+            (bool) defaults to False on Windows and True everywhere else.
+    """
+
+    def __init__(self, env_var, separator=os.pathsep, check_interval=2.0, case_sensitive=None):
+        self.env_var = env_var
+        self.separator = separator
+        self.check_interval = check_interval
+        if case_sensitive is None:
+            case_sensitive = os.name != "nt"
+        self.case_sensitive = case_sensitive
+
+        self._env_value = None
+        self._directories = list()
+        self._mtimes = list()
+        self._index = dict()
+        self._ordered_names = list()
+        self._last_check = 0.0
+        self._built = False
+
+    @property
+    def directories(self):
+        """ (list) the directories of the environment variable, in order of precedence """
+        self._validate()
+        return list(self._directories)
+
+    def refresh(self):
+        """ rebuilds the index right away """
+        self._env_value = os.environ.get(self.env_var)
+        directories = list()
+        if self._env_value:
+            for directory in pyutils.env_var_to_list(self.env_var, separator=self.separator):
+                if directory:
+                    directory = pyfile.expandnorm(directory)
+                    if directory not in directories:
+                        directories.append(directory)
+
+        index = dict()
+        ordered_names = list()
+        mtimes = list()
+        for rank, directory in enumerate(directories):
+            mtimes.append(_get_mtime(directory))
+            try:
+                entries = os.listdir(directory)
+            except OSError:
+                continue
+
+            for entry in entries:
+                key = self._key(entry)
+                if key not in index:
+                    index[key] = (rank, os.path.join(directory, entry))
+                    ordered_names.append(key)
+
+        self._directories = directories
+        self._mtimes = mtimes
+        self._index = index
+        self._ordered_names = ordered_names
+        self._last_check = time.time()
+        self._built = True
+
+    def resolve(self, name, extensions=None, default=None):
+        """
+        Args:
+            name:
+                (str) file or folder name to find, example: "maya.exe"
+            extensions:
+                (list) extensions to try after 'name' (example: [".py", ".mel"]).
+                The name as is gets tried first. Directory precedence wins over the order of the extensions.
+            default:
+                returned if the name is not found in any directory
+
+        Returns:
+            (str) full path of the first match
+        """
+        self._validate()
+        return self._lookup(name, extensions, default)
+
+    def resolve_all(self, names, extensions=None):
+        """
+        Resolves many names with a single validation of the index.
+
+        Returns:
+            (dict) name -> full path, or None for the names that were not found
+        """
+        self._validate()
+        return dict((name, self._lookup(name, extensions, None)) for name in names)
+
+    def glob(self, pattern):
+        """
+        Returns:
+            (list) full paths of every indexed name matching 'pattern' (example: "*.py"),
+            in order of precedence
+        """
+        self._validate()
+        index = self._index
+        return [index[name][1] for name in fnmatch.filter(self._ordered_names, self._key(pattern))]
+
+    def __contains__(self, name):
+        return self.resolve(name) is not None
+
+    def _lookup(self, name, extensions, default):
+        index = self._index
+        key = self._key(name)
+
+        if not extensions:
+            found = index.get(key)
+            return found[1] if found else default
+
+        best = index.get(key)
+        for extension in pyutils.make_list(extensions):
+            if not extension.startswith("."):
+                extension = "." + extension
+            found = index.get(key + self._key(extension))
+            if found and (best is None or found[0] < best[0]):
+                best = found
+
+        return best[1] if best else default
+
+    def _key(self, name):
+        if self.case_sensitive:
+            return name
+        return name.lower()
+
+    def _validate(self):
+        if not self._built or os.environ.get(self.env_var) != self._env_value:
+            self.refresh()
+            return
+
+        now = time.time()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+
+        for directory, mtime in zip(self._directories, self._mtimes):
+            if _get_mtime(directory) != mtime:
+                self.refresh()
+                return
+
+
+def _get_mtime(directory):
+    try:
+        return os.stat(directory).st_mtime
+    except OSError:
+        return None
@@ -1,8 +1,24 @@
+import os
 import json as json_
 import shared.python.file as pyfile
+import shared.python.utils as pyutils
+from shared.python.imports import lazy_import
 
+hashlib = lazy_import("hashlib")
 
-def json(path_or_file, obj=None, default=None, indent=4, sort_keys=True):
+# path -> (key of the data, mtime, size) of the files written with save(skip_unchanged=True)
+_SAVED_FINGERPRINTS = dict()
+
+
+def _dump(obj, file_object, indent, sort_keys):
+    if indent is None and not sort_keys:
+        # only dumps() uses the C encoder, and only for compact unsorted output. dump() is pure python.
+        file_object.write(json_.dumps(obj))
+    else:
+        json_.dump(obj, file_object, indent=indent, sort_keys=sort_keys)
+
+
+def json(path_or_file, obj=None, default=None, indent=4, sort_keys=True, normalizer=None):
     """
     Convenient to serialize and deserialize.
     IF you pass a value to arg 'obj', it will be serialize to 'path_or_file'.
@@ -23,6 +39,9 @@ def json(path_or_file, obj=None, default=None, indent=4, sort_keys=True):
         sort_keys:
             (bool)
             Save with keys sorted.
+        normalizer:
+            (utils.StringNormalizer)
+            When reading, converts unicode strings to str while the json is being decoded.
             
     Returns:
         None or data - depending on weather obj is set or not
@@ -40,15 +59,15 @@ def json(path_or_file, obj=None, default=None, indent=4, sort_keys=True):
         
         if path:
             try:
-                pyfile.mkdir(path)
+                pyfile.mkdir(pyfile.dirname(path) or ".")
             except:
                 raise Exception("invalid path: \"{0}\"".format(path))
                 
         if file_object:
-            json_.dump(obj, file_object, indent=indent, sort_keys=sort_keys)
+            _dump(obj, file_object, indent, sort_keys)
         else:
             with open(path, mode="w") as f:
-                json_.dump(obj, f, indent=indent, sort_keys=sort_keys)
+                _dump(obj, f, indent, sort_keys)
         
         return True
     
@@ -56,15 +75,24 @@ def json(path_or_file, obj=None, default=None, indent=4, sort_keys=True):
         if file_object:
             # json fails if the file is empty
             try:
-                data = json_.load(file_object)
+                data = json_.load(file_object, object_pairs_hook=normalizer)
+            except UnicodeEncodeError:
+                # a normalizer that failed, not an empty or invalid file
+                raise
             except ValueError:
-                data = default
+                return default
         else:
             with open(path, mode="r") as f:
                 try:
-                    data = json_.load(f)
+                    data = json_.load(f, object_pairs_hook=normalizer)
+                except UnicodeEncodeError:
+                    # a normalizer that failed, not an empty or invalid file
+                    raise
                 except ValueError:
-                    data = default
+                    return default
+        
+        if normalizer is not None:
+            data = normalizer.finish(data)
         
         return data
     
@@ -72,7 +100,7 @@ def json(path_or_file, obj=None, default=None, indent=4, sort_keys=True):
         return default
 
 
-def load(path_or_file, default=None, indent=4, sort_keys=True):
+def load(path_or_file, default=None, indent=4, sort_keys=True, normalizer=None):
     """
     Convenient way to load a JSON file to a dict()
 
@@ -88,16 +116,22 @@ def load(path_or_file, default=None, indent=4, sort_keys=True):
         sort_keys:
             (bool)
             save with keys sorted or unsorted.
+        normalizer:
+            (utils.StringNormalizer)
+            converts unicode strings to str (interned) in the same pass as the json decoding.
+            example:
+                data = load(path, normalizer=pyutils.StringNormalizer())
 
     Returns:
         (dict)
         the contents of the file.
 
     """
-    return json(path_or_file, obj=None, default=default, indent=indent, sort_keys=sort_keys)
+    return json(path_or_file, obj=None, default=default, indent=indent, sort_keys=sort_keys,
+                normalizer=normalizer)
 
 
-def save(path_or_file, obj, default=None, indent=4, sort_keys=True):
+def save(path_or_file, obj, default=None, indent=4, sort_keys=True, skip_unchanged=False):
     """
 
     Args:
@@ -115,10 +149,47 @@ def save(path_or_file, obj, default=None, indent=4, sort_keys=True):
         sort_keys:
             (bool)
             save with keys sorted or unsorted.
+        skip_unchanged:
+            (bool)
+            don't write the file if this process already saved the same data there and the file was not
+            touched since. Plain data is encoded once and the hash of the json text is compared, so the
+            check costs the encoding and saves the write. Data made with utils.track() is compared with
+            utils.fingerprint() instead, which only hashes again what changed: much cheaper on big data
+            with small edits.
 
     Returns:
         (bool)
-        If file was successfully written or not.
+        If file was successfully written or not. True when the write was skipped, the file already
+        holds obj.
 
     """
-    return json(path_or_file, obj=obj, default=default, indent=indent, sort_keys=sort_keys)
+    if not skip_unchanged or isinstance(path_or_file, file) or obj is None:
+        return json(path_or_file, obj=obj, default=default, indent=indent, sort_keys=sort_keys)
+    
+    path = pyfile.expand(path_or_file)
+    text = None
+    if pyutils.is_tracked(obj):
+        key = ("fingerprint", pyutils.fingerprint(obj), indent, sort_keys)
+    else:
+        # fingerprint() of data that is not tracked costs more than encoding it
+        text = json_.dumps(obj, indent=indent, sort_keys=sort_keys)
+        key = ("text", hashlib.sha1(text).hexdigest())
+    saved = _SAVED_FINGERPRINTS.get(path)
+    if saved is not None and saved[0] == key:
+        try:
+            file_stat = os.stat(path)
+        except OSError:
+            file_stat = None
+        if file_stat is not None and (file_stat.st_mtime, file_stat.st_size) == saved[1:]:
+            return True
+    
+    if text is None:
+        result = json(path, obj=obj, default=default, indent=indent, sort_keys=sort_keys)
+    else:
+        pyfile.mkdir(pyfile.dirname(path) or ".")
+        with open(path, mode="w") as f:
+            f.write(text)
+        result = True
+    file_stat = os.stat(path)
+    _SAVED_FINGERPRINTS[path] = (key, file_stat.st_mtime, file_stat.st_size)
+    return result
@@ -0,0 +1,274 @@
+"""
+Snapshots of a directory tree, to find what changed under it since the last run (incremental
+publishes, backups...).
+
+scan() records every file of a tree (size, mtime, inode and optionally a hash) in a Manifest that can be
+saved to disk. Given the manifest of the previous run, scan() only lists the folders whose mtime changed,
+and diff() turns two manifests into the files added, removed, modified and moved.
+
+example:
+    changes, manifest = changes_since(r"P:\\project\\publish", r"P:\\project\\.publish_manifest.json")
+    for path in changes.added + changes.modified:
+        upload(path)
+
+scan levels, from safest to fastest:
+    SCAN_FULL:  list every folder and stat every file.
+    SCAN_STAT:  folders whose mtime did not change are not listed again, their files are still stat'ed,
+                so edits to existing files are found. This is the default.
+    SCAN_QUICK: folders whose mtime did not change are reused as they are. The mtime of a folder only
+                changes when files are added, removed or renamed in it, so files edited in place are
+                NOT found in those folders. The cost of a scan is one stat per folder plus the changed folders.
+"""
+# python
+import os
+import stat
+import time
+
+# internal
+import shared.python.file as pyfile
+import shared.python.serialize as serialize
+import shared.python.utils as pyutils
+
+SCAN_FULL = "full"
+SCAN_STAT = "stat"
+SCAN_QUICK = "quick"
+
+MANIFEST_VERSION = 1
+
+# entries modified this close to the scan could change again within the same mtime tick,
+# they are checked again on the next scan no matter what their mtime says
+_RACY_SECONDS = 2.0
+
+# indices of a file entry: [size, mtime, inode, hash]
+SIZE = 0
+MTIME = 1
+INODE = 2
+HASH = 3
+
+
+class Manifest(object):
+    """
+    What a scan found under 'root'.
+    dirs: relative folder path ("" for the root) -> [mtime, {file name: [size, mtime, inode, hash]}, [sub folder names]]
+    """
+
+    def __init__(self, root, dirs=None, scan_time=None, algorithm=None):
+        self.root = root
+        self.dirs = dirs if dirs is not None else dict()
+        self.time = scan_time
+        self.algorithm = algorithm
+
+    def __len__(self):
+        return sum(len(entry[1]) for entry in self.dirs.values())
+
+    def __repr__(self):
+        return "<Manifest {0!r} {1} files>".format(self.root, len(self))
+
+    def files(self):
+        """ Yields (relative path, [size, mtime, inode, hash]) for every file """
+        for dir_path, entry in self.dirs.iteritems():
+            for name, file_entry in entry[1].iteritems():
+                yield os.path.join(dir_path, name), file_entry
+
+    def total_size(self):
+        return sum(file_entry[SIZE] for _, file_entry in self.files())
+
+    def to_dict(self):
+        return {"version": MANIFEST_VERSION, "root": self.root, "time": self.time, "algorithm": self.algorithm,
+                "dirs": self.dirs}
+
+    def save(self, path):
+        return serialize.save(path, self.to_dict(), indent=None, sort_keys=False)
+
+    @classmethod
+    def load(cls, path):
+        """ Returns None if there is no manifest at 'path' or if it was saved by an incompatible version """
+        data = serialize.load(path, normalizer=pyutils.StringNormalizer())
+        if not data or data.get("version") != MANIFEST_VERSION:
+            return None
+        return cls(data["root"], data["dirs"], data["time"], data.get("algorithm"))
+
+
+class ChangeSet(object):
+    """
+    Relative paths of the files that changed between two manifests.
+    moved is a list of (old path, new path), moved files are not in added or removed.
+    """
+
+    def __init__(self, added=None, removed=None, modified=None, moved=None):
+        self.added = added or list()
+        self.removed = removed or list()
+        self.modified = modified or list()
+        self.moved = moved or list()
+
+    def __len__(self):
+        return len(self.added) + len(self.removed) + len(self.modified) + len(self.moved)
+
+    def __nonzero__(self):
+        return bool(len(self))
+
+    def __repr__(self):
+        return "<ChangeSet added={0} removed={1} modified={2} moved={3}>".format(
+            len(self.added), len(self.removed), len(self.modified), len(self.moved))
+
+    def to_dict(self):
+        return {"added": self.added, "removed": self.removed, "modified": self.modified, "moved": self.moved}
+
+
+def _file_entry(path, file_stat, previous, algorithm, scan_time):
+    entry = [file_stat.st_size, file_stat.st_mtime, file_stat.st_ino, None]
+    if not algorithm:
+        return entry
+
+    if (previous and previous[HASH] and previous[SIZE] == entry[SIZE] and previous[MTIME] == entry[MTIME]
+            and previous[INODE] == entry[INODE] and scan_time - entry[MTIME] > _RACY_SECONDS):
+        entry[HASH] = previous[HASH]
+    else:
+        try:
+            entry[HASH] = pyfile.hash_file(path, algorithm)
+        except IOError:
+            pass
+    return entry
+
+
+def scan(root, previous=None, level=SCAN_STAT, algorithm=None):
+    """
+    Args:
+        root:
+            (str) folder to scan
+        previous:
+            (Manifest) result of the previous scan of the same root, unchanged folders are not listed again
+        level:
+            (str) SCAN_FULL, SCAN_STAT or SCAN_QUICK, see the module documentation
+        algorithm:
+            (str) hashlib algorithm to hash new and changed files with, None to not hash.
+            Hashes are carried over for files whose size, mtime and inode did not change.
+
+    Returns:
+        (Manifest)
+    """
+    root = pyfile.expandnorm(root)
+    scan_time = time.time()
+    if previous is not None and (previous.algorithm != algorithm or previous.root != root):
+        previous = None
+    previous_dirs = previous.dirs if previous is not None else dict()
+    # anything changed within the racy window of the previous scan is listed again
+    racy_limit = previous.time - _RACY_SECONDS if previous is not None and previous.time else 0
+
+    dirs = dict()
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        abs_dir = os.path.join(root, rel_dir) if rel_dir else root
+        try:
+            dir_mtime = os.stat(abs_dir).st_mtime
+        except OSError:
+            continue
+
+        old = previous_dirs.get(rel_dir)
+        unchanged = (level != SCAN_FULL and old is not None and old[0] == dir_mtime and dir_mtime < racy_limit)
+
+        if unchanged and level == SCAN_QUICK:
+            dirs[rel_dir] = [dir_mtime, old[1], old[2]]
+            stack.extend(os.path.join(rel_dir, name) for name in old[2])
+            continue
+
+        files = dict()
+        sub_dirs = list()
+        if unchanged:
+            names = list(old[1]) + list(old[2])
+        else:
+            try:
+                names = os.listdir(abs_dir)
+            except OSError:
+                continue
+
+        old_files = old[1] if old is not None else dict()
+        for name in names:
+            path = os.path.join(abs_dir, name)
+            try:
+                file_stat = os.lstat(path)
+            except OSError:
+                continue
+            if stat.S_ISDIR(file_stat.st_mode):
+                sub_dirs.append(name)
+                stack.append(os.path.join(rel_dir, name))
+            else:
+                files[name] = _file_entry(path, file_stat, old_files.get(name), algorithm, scan_time)
+
+        dirs[rel_dir] = [dir_mtime, files, sub_dirs]
+
+    return Manifest(root, dirs, scan_time, algorithm)
+
+
+def diff(old, new, detect_moves=True):
+    """
+    Args:
+        old: (Manifest) earlier scan, None is treated as an empty tree
+        new: (Manifest) later scan
+        detect_moves: (bool) pair removed and added files that have the same inode (or the same hash)
+    Returns:
+        (ChangeSet)
+    """
+    old_files = dict(old.files()) if old is not None else dict()
+    new_files = dict(new.files())
+
+    changes = ChangeSet()
+    for path, entry in new_files.iteritems():
+        previous = old_files.get(path)
+        if previous is None:
+            changes.added.append(path)
+        elif (previous[SIZE] != entry[SIZE] or previous[MTIME] != entry[MTIME]
+              or (previous[HASH] and entry[HASH] and previous[HASH] != entry[HASH])):
+            changes.modified.append(path)
+    changes.removed = [path for path in old_files if path not in new_files]
+
+    if detect_moves and changes.added and changes.removed:
+        _detect_moves(changes, old_files, new_files)
+
+    for paths in (changes.added, changes.removed, changes.modified, changes.moved):
+        paths.sort()
+    return changes
+
+
+def _detect_moves(changes, old_files, new_files):
+    # a rename keeps the inode, size and mtime. The hash catches copies across devices and re-writes.
+    by_inode = dict()
+    by_hash = dict()
+    for path in changes.removed:
+        entry = old_files[path]
+        by_inode.setdefault((entry[INODE], entry[SIZE], entry[MTIME]), path)
+        if entry[HASH]:
+            by_hash.setdefault((entry[HASH], entry[SIZE]), path)
+
+    moved_from = set()
+    added = list()
+    for path in changes.added:
+        entry = new_files[path]
+        source = by_inode.get((entry[INODE], entry[SIZE], entry[MTIME]))
+        if (source is None or source in moved_from) and entry[HASH]:
+            source = by_hash.get((entry[HASH], entry[SIZE]))
+        if source is not None and source not in moved_from:
+            moved_from.add(source)
+            changes.moved.append((source, path))
+        else:
+            added.append(path)
+
+    changes.added = added
+    changes.removed = [path for path in changes.removed if path not in moved_from]
+
+
+def changes_since(root, manifest_path, level=SCAN_STAT, algorithm=None, save=True):
+    """
+    Scans 'root', compares it with the manifest saved at 'manifest_path' and saves the new manifest there.
+    The first run reports every file as added.
+
+    Returns:
+        (tuple) (ChangeSet, Manifest)
+    """
+    previous = Manifest.load(manifest_path)
+    manifest = scan(root, previous=previous, level=level, algorithm=algorithm)
+    changes = diff(previous, manifest)
+    if save:
+        manifest.save(manifest_path)
+    return changes, manifest
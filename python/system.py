@@ -1,40 +1,774 @@
-import subprocess
+# python
+import collections
+import errno
 import getpass
+import itertools
+import multiprocessing
+import os
+import Queue
 import socket
+import subprocess
+import threading
+import time
+
+# internal
+from shared.python.imports import lazy_import
+
+serialize = lazy_import("shared.python.serialize")
+
+
+# """ ------------------------------------------------------------ """
+# """ ------------------------------------------------------------ """
+# """ ------------------------- IDENTITY ------------------------- """
+# """ ------------------------------------------------------------ """
+# """ ------------------------------------------------------------ """
+
+# resolved once per process, name resolution can stall for seconds on some networks
+_HOST_IDENTITY = dict()
+_HOST_IDENTITY_LOCK = threading.Lock()
+_HOST_IDENTITY_REFRESHER = dict()
+
+
+def _resolve_local_ip():
+    return socket.gethostbyname(_get_host_identity("computer_name", True))
+
+
+# each value is resolved on its own, only the local IP needs name resolution
+_HOST_IDENTITY_RESOLVERS = collections.OrderedDict([
+    ("user", getpass.getuser),
+    ("computer_name", socket.gethostname),
+    ("local_ip", _resolve_local_ip),
+])
+
+
+def refresh_host_identity():
+    """
+    Resolves the user name, computer name and local IP again and updates the cached values.
+    Raises socket.error if the local IP can't be resolved, the values resolved before it are still updated.
+    Returns:
+        (dict) the new values
+    """
+    identity = dict()
+    for key in _HOST_IDENTITY_RESOLVERS:
+        identity[key] = _get_host_identity(key, cached=False)
+    return identity
+
+
+def _get_host_identity(key, cached):
+    if cached:
+        try:
+            return _HOST_IDENTITY[key]
+        except KeyError:
+            pass
+    value = _HOST_IDENTITY_RESOLVERS[key]()
+    with _HOST_IDENTITY_LOCK:
+        _HOST_IDENTITY[key] = value
+    return value
+
+
+def start_host_identity_refresh(interval=300.0):
+    """
+    Refreshes the cached host identity every 'interval' seconds in a background thread, so a slow
+    name lookup never stalls the callers of get_local_ip, get_computer_name or get_windows_user.
+    Calling it again changes the interval of the running thread.
+    """
+    with _HOST_IDENTITY_LOCK:
+        _HOST_IDENTITY_REFRESHER["interval"] = interval
+        if _HOST_IDENTITY_REFRESHER.get("thread"):
+            return
+        stop = threading.Event()
+        thread = threading.Thread(target=_refresh_host_identity_loop, args=(stop,), name="host_identity_refresh")
+        thread.daemon = True
+        _HOST_IDENTITY_REFRESHER.update(thread=thread, stop=stop)
+    thread.start()
+
+
+def stop_host_identity_refresh():
+    with _HOST_IDENTITY_LOCK:
+        stop = _HOST_IDENTITY_REFRESHER.pop("stop", None)
+        _HOST_IDENTITY_REFRESHER.pop("thread", None)
+    if stop:
+        stop.set()
+
 
+def _refresh_host_identity_loop(stop):
+    while not stop.is_set():
+        try:
+            refresh_host_identity()
+        except Exception:
+            pass
+        stop.wait(_HOST_IDENTITY_REFRESHER.get("interval", 300.0))
 
-def get_windows_user():
+
+def get_windows_user(cached=True):
     """
     Helper function to get the windows user name
+    Args:
+        cached: (bool) use the value resolved earlier in this process, see refresh_host_identity
     Returns:
         (str)
     """
-    return getpass.getuser()
+    return _get_host_identity("user", cached)
+
+
+def get_computer_name(cached=True):
+    """
+    Helper function to get the local computer name
+    Args:
+        cached: (bool) use the value resolved earlier in this process, see refresh_host_identity
+    Returns:
+        (str) Name of the PC that ran this function.
+
+    """
+    return _get_host_identity("computer_name", cached)
 
 
+def get_local_ip(cached=True):
+    """
+    Helper function to get the local IP address of the computer.
+    Args:
+        cached: (bool) use the value resolved earlier in this process, see refresh_host_identity
+    Returns:
+        (str) IP address of the computer that ran this function.
+    """
+    return _get_host_identity("local_ip", cached)
+
+
+# """ ------------------------------------------------------------ """
+# """ ------------------------------------------------------------ """
+# """ ------------------------- PROCESSES ------------------------ """
+# """ ------------------------------------------------------------ """
+# """ ------------------------------------------------------------ """
+
 def run_application_async(path):
     """
     Helper function to run Popen in a way that is more readable.
+    The process is not tracked, use JobRunner to cap, capture or time processes.
     Args:
         path: (str) Popen arg
     """
     subprocess.Popen(path)
 
 
-def get_computer_name():
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_FINISHED = "finished"
+JOB_FAILED = "failed"
+JOB_TIMED_OUT = "timed_out"
+JOB_CANCELLED = "cancelled"
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobTimeout(Exception):
+    pass
+
+
+class Job(object):
     """
-    Helper function to get the local computer name
-    Returns:
-        (str) Name of the PC that ran this function.
+    A process submitted to a JobRunner. Works like a concurrent.futures.Future:
+    done(), cancel(), result(timeout), exception(timeout), add_done_callback(fn).
+    result() returns the exit code of the process.
+
+    states:
+        pending -> running -> finished (the process exited, whatever the exit code),
+        failed (the process could not be started), timed_out or cancelled.
+
+    Output is captured line by line while the process runs (stdout_lines, stderr_lines), on_stdout
+    and on_stderr are called with every line from the reader threads.
+    """
+
+    def __init__(self, command, priority=0, timeout=None, retries=0, retry_delay=0.0, cwd=None, env=None,
+                 shell=False, on_stdout=None, on_stderr=None):
+        self.command = command
+        self.priority = priority
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.cwd = cwd
+        self.env = env
+        self.shell = shell
+        self.on_stdout = on_stdout
+        self.on_stderr = on_stderr
+
+        self.state = JOB_PENDING
+        self.returncode = None
+        self.error = None
+        self.attempts = 0
+        self.stdout_lines = list()
+        self.stderr_lines = list()
+
+        # metrics, in seconds
+        self.submitted_time = time.time()
+        self.start_time = None
+        self.end_time = None
+        self.wall_time = None
+        self.cpu_time = None
+
+        self._process = None
+        self._killed = False
+        self._timed_out = False
+        self._lock = threading.Lock()
+        self._done_event = threading.Event()
+        self._callbacks = list()
+
+    def __repr__(self):
+        return "<Job {0!r} {1}>".format(self.command, self.state)
+
+    @property
+    def stdout(self):
+        return "".join(self.stdout_lines)
+
+    @property
+    def stderr(self):
+        return "".join(self.stderr_lines)
+
+    @property
+    def succeeded(self):
+        return self.state == JOB_FINISHED and self.returncode == 0
+
+    @property
+    def pid(self):
+        return self._process.pid if self._process else None
+
+    def metrics(self):
+        """
+        Returns:
+            (dict) queue_time, wall_time and cpu_time (user + system) of the last attempt, in seconds.
+            cpu_time is None on platforms without os.wait4.
+        """
+        queue_time = None
+        if self.start_time is not None:
+            queue_time = self.start_time - self.submitted_time
+        return {"attempts": self.attempts, "queue_time": queue_time, "wall_time": self.wall_time,
+                "cpu_time": self.cpu_time, "returncode": self.returncode, "state": self.state}
+
+    def done(self):
+        return self._done_event.is_set()
+
+    def running(self):
+        return self.state == JOB_RUNNING
+
+    def cancelled(self):
+        return self.state == JOB_CANCELLED
+
+    def cancel(self):
+        """ Cancels the job if it has not started yet. Use kill() to stop a running job. """
+        with self._lock:
+            if self.state != JOB_PENDING:
+                return self.state == JOB_CANCELLED
+            self.state = JOB_CANCELLED
+        self._set_done()
+        return True
+
+    def kill(self):
+        """ Cancels the job if it is pending, kills its process and skips the retries if it is running """
+        if self.cancel():
+            return
+        with self._lock:
+            self._killed = True
+            self._kill_running(self._process)
+
+    def _kill_running(self, process):
+        """
+        Kills 'process' if it has not been reaped yet, returns True if it was killed. Call it with the lock held:
+        _wait_process sets the returncode under the lock once the pid is reaped, past that point the pid
+        can already belong to another process.
+        """
+        if self.state == JOB_RUNNING and process is not None and process.returncode is None:
+            _kill_process(process)
+            return True
+        return False
+
+    def wait(self, timeout=None):
+        """ Returns True if the job is done """
+        self._done_event.wait(timeout)
+        return self.done()
+
+    def result(self, timeout=None):
+        """
+        Waits for the job and returns the exit code of its process.
+        Raises JobTimeout if the job is not done after 'timeout' seconds, JobCancelled if it was
+        cancelled or the error raised while starting the process.
+        """
+        error = self.exception(timeout)
+        if error is not None:
+            raise error
+        return self.returncode
+
+    def exception(self, timeout=None):
+        if not self.wait(timeout):
+            raise JobTimeout("job not done after {0} seconds: {1!r}".format(timeout, self.command))
+        if self.cancelled():
+            raise JobCancelled(repr(self.command))
+        return self.error
+
+    def add_done_callback(self, fn):
+        """ fn(job) is called from the worker thread when the job is done, right away if it already is """
+        with self._lock:
+            if not self.done():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def _set_done(self):
+        with self._lock:
+            self._done_event.set()
+            callbacks, self._callbacks = self._callbacks, list()
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                pass
+
+    def _execute(self):
+        while True:
+            with self._lock:
+                if self.state == JOB_CANCELLED:
+                    return
+                self.state = JOB_RUNNING
+            self.attempts += 1
+            self._run_once()
+            if self.succeeded or self._killed or self.attempts > self.retries:
+                break
+            time.sleep(self.retry_delay)
 
+        if self._killed and self.state != JOB_FAILED:
+            self.state = JOB_CANCELLED
+        self._set_done()
+
+    def _run_once(self):
+        self.stdout_lines = list()
+        self.stderr_lines = list()
+        self.returncode = None
+        self.error = None
+        self._timed_out = False
+        self.start_time = time.time()
+
+        try:
+            process = subprocess.Popen(self.command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                       cwd=self.cwd, env=self.env, shell=self.shell, close_fds=os.name != "nt")
+        except (OSError, ValueError) as e:
+            self.error = e
+            self.state = JOB_FAILED
+            self.end_time = time.time()
+            self.wall_time = self.end_time - self.start_time
+            return
+
+        with self._lock:
+            self._process = process
+            if self._killed:
+                self._kill_running(process)
+
+        # one reader per pipe so a full stderr pipe can never block a process we are reading stdout from
+        readers = [
+            threading.Thread(target=_pump, args=(process.stdout, self.stdout_lines, self.on_stdout)),
+            threading.Thread(target=_pump, args=(process.stderr, self.stderr_lines, self.on_stderr)),
+        ]
+        for reader in readers:
+            reader.daemon = True
+            reader.start()
+
+        timer = None
+        if self.timeout:
+            timer = threading.Timer(self.timeout, self._on_timeout, args=(process,))
+            timer.daemon = True
+            timer.start()
+
+        self.returncode, self.cpu_time = _wait_process(process, self._lock)
+
+        if timer:
+            timer.cancel()
+        for reader in readers:
+            reader.join()
+
+        self.end_time = time.time()
+        self.wall_time = self.end_time - self.start_time
+        self.state = JOB_TIMED_OUT if self._timed_out else JOB_FINISHED
+
+    def _on_timeout(self, process):
+        with self._lock:
+            # the process may have exited while the timer fired
+            if self._kill_running(process):
+                self._timed_out = True
+
+
+def _pump(stream, lines, callback):
+    try:
+        for line in iter(stream.readline, b""):
+            lines.append(line)
+            if callback:
+                try:
+                    callback(line)
+                except Exception:
+                    pass
+    finally:
+        stream.close()
+
+
+def _kill_process(process):
+    try:
+        process.kill()
+    except OSError:
+        # already exited
+        pass
+
+
+def _wait_process(process, lock):
     """
-    return socket.gethostname()
+    waits for the process and returns its exit code and the cpu time it used.
+    The returncode is set under 'lock', kills check it under the same lock.
+    """
+    if not hasattr(os, "wait4"):
+        return process.wait(), None
+
+    while True:
+        try:
+            _, status, usage = os.wait4(process.pid, 0)
+            break
+        except OSError as e:
+            if e.errno == errno.EINTR:
+                continue
+            if e.errno == errno.ECHILD:
+                # reaped by someone else
+                return process.wait(), None
+            raise
+
+    with lock:
+        if os.WIFSIGNALED(status):
+            process.returncode = -os.WTERMSIG(status)
+        else:
+            process.returncode = os.WEXITSTATUS(status)
+    return process.returncode, usage.ru_utime + usage.ru_stime
 
 
-def get_local_ip():
+class JobRunner(object):
+    """
+    Bounded pool of processes fed from a priority queue.
+    At most max_workers processes run at the same time, jobs with the lowest priority number start first,
+    jobs with the same priority start in the order they were submitted.
+
+    example:
+        with JobRunner() as runner:
+            jobs = [runner.submit(["mayapy", "export.py", scene]) for scene in scenes]
+            for job in as_completed(jobs):
+                print(job.returncode, job.metrics())
+
+    Args:
+        max_workers:
+            (int) how many processes can run at once, defaults to the cpu count.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or multiprocessing.cpu_count()
+        self._queue = Queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._threads = list()
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown(wait=True)
+
+    def submit(self, command, priority=0, **kwargs):
+        """
+        Args:
+            command:
+                (str or list) Popen arg
+            priority:
+                (int) lower numbers start first
+            kwargs:
+                timeout, retries, retry_delay, cwd, env, shell, on_stdout, on_stderr. See Job.
+
+        Returns:
+            (Job)
+        """
+        job = Job(command, priority=priority, **kwargs)
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot submit jobs after shutdown")
+            self._queue.put((priority, next(self._counter), job))
+            if len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._worker, name="job_runner_{0}".format(len(self._threads)))
+                thread.daemon = True
+                self._threads.append(thread)
+                thread.start()
+        return job
+
+    def map(self, commands, priority=0, **kwargs):
+        """ Submits every command and returns their jobs, in the same order """
+        return [self.submit(command, priority=priority, **kwargs) for command in commands]
+
+    def shutdown(self, wait=True, cancel_pending=False):
+        """
+        Stops accepting jobs. The jobs already queued still run unless cancel_pending is True.
+        """
+        with self._lock:
+            self._shutdown = True
+            threads = list(self._threads)
+
+        if cancel_pending:
+            while True:
+                try:
+                    _, _, job = self._queue.get_nowait()
+                except Queue.Empty:
+                    break
+                if job is not None:
+                    job.cancel()
+
+        for _ in threads:
+            self._queue.put((float("inf"), next(self._counter), None))
+
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def _worker(self):
+        while True:
+            _, _, job = self._queue.get()
+            if job is None:
+                return
+            job._execute()
+
+
+def as_completed(jobs, timeout=None):
+    """ Yields the jobs as they finish. Raises JobTimeout if they are not all done after 'timeout' seconds """
+    jobs = list(jobs)
+    finished = Queue.Queue()
+    for job in jobs:
+        job.add_done_callback(finished.put)
+
+    end_time = None if timeout is None else time.time() + timeout
+    for _ in jobs:
+        remaining = None if end_time is None else max(0.0, end_time - time.time())
+        try:
+            yield finished.get(timeout=remaining)
+        except Queue.Empty:
+            raise JobTimeout("jobs not done after {0} seconds".format(timeout))
+
+
+def wait_for_jobs(jobs, timeout=None):
     """
-    Helper function to get the local IP address of the computer.
     Returns:
-        (str) IP address of the computer that ran this function.
+        (tuple) (done, not_done) lists of jobs after all the jobs are done or 'timeout' seconds passed.
+    """
+    end_time = None if timeout is None else time.time() + timeout
+    for job in jobs:
+        remaining = None if end_time is None else max(0.0, end_time - time.time())
+        if not job.wait(remaining):
+            break
+    done = [job for job in jobs if job.done()]
+    not_done = [job for job in jobs if not job.done()]
+    return done, not_done
+
+
+# """ ------------------------------------------------------------ """
+# """ ------------------------------------------------------------ """
+# """ ------------------------- TELEMETRY ------------------------ """
+# """ ------------------------------------------------------------ """
+# """ ------------------------------------------------------------ """
+
+def _read_proc(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except (IOError, OSError):
+        return None
+
+
+def _read_cpu_times():
+    # first line of /proc/stat: cpu user nice system idle iowait irq softirq steal ...
+    content = _read_proc("/proc/stat")
+    if not content:
+        return None
+    values = [int(v) for v in content.split("\n", 1)[0].split()[1:]]
+    idle = values[3] + (values[4] if len(values) > 4 else 0)
+    return sum(values), idle
+
+
+def _read_memory():
+    content = _read_proc("/proc/meminfo")
+    if not content:
+        return None
+    info = dict()
+    for line in content.splitlines():
+        key, _, value = line.partition(":")
+        info[key] = int(value.split()[0]) * 1024
+    total = info.get("MemTotal", 0)
+    available = info.get("MemAvailable", info.get("MemFree", 0) + info.get("Cached", 0))
+    return {"total": total, "available": available, "used": total - available}
+
+
+def _read_disk_io():
+    # /proc/diskstats fields: major minor name reads ... sectors_read ... writes ... sectors_written
+    content = _read_proc("/proc/diskstats")
+    if not content:
+        return None
+    # only whole devices, partitions would be counted twice
+    try:
+        devices = set(os.listdir("/sys/block"))
+    except OSError:
+        devices = None
+
+    read_bytes = 0
+    write_bytes = 0
+    for line in content.splitlines():
+        fields = line.split()
+        if len(fields) < 10:
+            continue
+        name = fields[2]
+        if name.startswith(("loop", "ram")):
+            continue
+        if devices is not None and name.replace("/", "!") not in devices:
+            continue
+        read_bytes += int(fields[5]) * 512
+        write_bytes += int(fields[9]) * 512
+    return read_bytes, write_bytes
+
+
+def _read_load():
+    content = _read_proc("/proc/loadavg")
+    if not content:
+        return None
+    return [float(v) for v in content.split()[:3]]
+
+
+def _read_process(pid):
+    # /proc/<pid>/stat, utime and stime are fields 14 and 15, in clock ticks.
+    # The command name can have spaces, the fields are counted after its closing parenthesis.
+    content = _read_proc("/proc/{0}/stat".format(pid))
+    statm = _read_proc("/proc/{0}/statm".format(pid))
+    if not content or not statm:
+        return None
+    fields = content.rpartition(")")[2].split()
+    ticks = float(os.sysconf("SC_CLK_TCK"))
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    return {"cpu_time": (int(fields[11]) + int(fields[12])) / ticks, "rss": int(statm.split()[1]) * page_size}
+
+
+class TelemetrySampler(object):
     """
-    return socket.gethostbyname(get_computer_name())
+    Samples cpu, memory, disk I/O and load from /proc every 'interval' seconds in a background thread
+    and keeps the last 'size' samples in a ring buffer. Reading /proc costs a few file reads per sample,
+    cheap enough to leave running next to a job.
+
+    example:
+        with TelemetrySampler(interval=0.5) as sampler:
+            run_the_job()
+        sampler.export("/tmp/job_telemetry.json")
+
+    Every sample is a dict:
+        time, cpu_percent, memory_total, memory_used, memory_available,
+        disk_read_bytes, disk_write_bytes (since the previous sample), load (1, 5, 15 minutes)
+        and if 'pid' is given: process_cpu_time, process_rss
+
+    Values that can't be read on this platform are None.
+    """
+
+    def __init__(self, interval=1.0, size=3600, pid=None):
+        self.interval = interval
+        self.pid = pid
+        self._samples = collections.deque(maxlen=size)
+        self._previous_cpu = _read_cpu_times()
+        self._previous_disk = _read_disk_io()
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def sample(self):
+        """ Takes one sample right away, adds it to the buffer and returns it """
+        cpu = _read_cpu_times()
+        disk = _read_disk_io()
+        memory = _read_memory() or dict()
+
+        cpu_percent = None
+        if cpu and self._previous_cpu:
+            total = cpu[0] - self._previous_cpu[0]
+            idle = cpu[1] - self._previous_cpu[1]
+            if total > 0:
+                cpu_percent = 100.0 * (total - idle) / total
+
+        disk_read = disk_write = None
+        if disk and self._previous_disk:
+            disk_read = disk[0] - self._previous_disk[0]
+            disk_write = disk[1] - self._previous_disk[1]
+
+        self._previous_cpu = cpu
+        self._previous_disk = disk
+
+        sample = {
+            "time": time.time(),
+            "cpu_percent": cpu_percent,
+            "memory_total": memory.get("total"),
+            "memory_used": memory.get("used"),
+            "memory_available": memory.get("available"),
+            "disk_read_bytes": disk_read,
+            "disk_write_bytes": disk_write,
+            "load": _read_load(),
+        }
+        if self.pid is not None:
+            process = _read_process(self.pid) or dict()
+            sample["process_cpu_time"] = process.get("cpu_time")
+            sample["process_rss"] = process.get("rss")
+
+        with self._lock:
+            self._samples.append(sample)
+        return sample
+
+    def start(self):
+        if self.is_running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="telemetry_sampler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+    def snapshot(self):
+        """ Returns a copy of the samples in the buffer, oldest first """
+        with self._lock:
+            return list(self._samples)
+
+    def summary(self):
+        """ Returns min, max and average of the numeric values in the buffer """
+        samples = self.snapshot()
+        summary = dict()
+        for key in ("cpu_percent", "memory_used", "disk_read_bytes", "disk_write_bytes", "process_rss"):
+            values = [s[key] for s in samples if s.get(key) is not None]
+            if values:
+                summary[key] = {"min": min(values), "max": max(values), "average": sum(values) / float(len(values))}
+        return summary
+
+    def export(self, path_or_file):
+        """ Saves the samples in the buffer as json """
+        return serialize.save(path_or_file, {"interval": self.interval, "samples": self.snapshot()})
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
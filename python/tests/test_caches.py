@@ -0,0 +1,97 @@
+"""
+Round-trips of the caches saved as json, with file names that are not ascii.
+
+python -m unittest discover -s shared/python/tests -t .
+"""
+# python
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+# internal
+import shared.python.disk_usage as disk_usage
+import shared.python.file as pyfile
+import shared.python.path_trie as path_trie
+import shared.python.serialize as serialize
+import shared.python.snapshot as snapshot
+import shared.python.utils as pyutils
+
+# utf-8 bytes, what os.listdir returns for these names on linux
+NAMES = ["plain.txt", "caf\xc3\xa9.txt", "\xe6\x97\xa5\xe6\x9c\xac.ma"]
+FOLDER = "r\xc3\xa9pertoire"
+
+
+class NonAsciiCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.temp_dir, "tree")
+        os.makedirs(os.path.join(self.root, FOLDER))
+        for folder in ("", FOLDER):
+            for name in NAMES:
+                with open(os.path.join(self.root, folder, name), "wb") as f:
+                    f.write(name * 10)
+
+        # folders modified within seconds of a scan are always scanned again
+        old = time.time() - 3600
+        for dir_path, dir_names, file_names in os.walk(self.root):
+            for name in dir_names + file_names:
+                os.utime(os.path.join(dir_path, name), (old, old))
+            os.utime(dir_path, (old, old))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def cache_path(self, name):
+        return os.path.join(self.temp_dir, name)
+
+    def test_serialize_load(self):
+        path = self.cache_path("data.json")
+        with open(path, "w") as f:
+            f.write('{"name": "caf\\u00e9", "tags": ["\\u65e5"]}')
+        data = serialize.load(path, default=dict(), normalizer=pyutils.StringNormalizer())
+        self.assertEqual(data, {"name": "caf\xc3\xa9", "tags": ["\xe6\x97\xa5"]})
+
+    def test_manifest(self):
+        manifest_path = self.cache_path("manifest.json")
+        changes, manifest = snapshot.changes_since(self.root, manifest_path)
+        self.assertEqual(len(changes.added), len(NAMES) * 2)
+
+        loaded = snapshot.Manifest.load(manifest_path)
+        self.assertIsNotNone(loaded)
+        self.assertEqual(sorted(path for path, _ in loaded.files()), sorted(path for path, _ in manifest.files()))
+        changes, _ = snapshot.changes_since(self.root, manifest_path)
+        self.assertFalse(changes)
+
+    def test_path_trie(self):
+        trie = path_trie.PathTrie(pyfile.walk(self.root))
+        path = self.cache_path("trie.json")
+        trie.save(path)
+        loaded = path_trie.PathTrie.load(path)
+        self.assertEqual(loaded, trie)
+        self.assertIn(os.path.join(self.root, FOLDER, NAMES[1]), loaded)
+
+    def test_hash_cache(self):
+        paths = pyfile.walk(self.root)
+        path = self.cache_path("hashes.json")
+        cache = pyfile.HashCache(path)
+        hashes = pyfile.hash_files(paths, cache=cache)
+        cache.save()
+
+        loaded = pyfile.HashCache(path)
+        for file_path in paths:
+            self.assertEqual(loaded.get(file_path, os.stat(file_path), "sha1"), hashes[file_path])
+
+    def test_disk_usage(self):
+        path = self.cache_path("disk_usage.json")
+        first = disk_usage.analyze(self.root, cache_path=path)
+        second = disk_usage.analyze(self.root, cache_path=path)
+        self.assertEqual(second.rescanned, 0)
+        self.assertEqual(second.size, first.size)
+        self.assertEqual(second.files, len(NAMES) * 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,349 @@
+"""
+Resumable copies of large files, for network shares.
+
+The file is copied in large chunks to "<dst>.partial". After every chunk the partial file is flushed to
+disk and the hash of the chunk is added to a checkpoint next to it ("<dst>.partial.json"). When a copy is
+interrupted (dropped connection, killed process...) the next copy of the same file starts again after the
+last chunk that is still intact. Once everything is copied, the partial file is read back and checked
+against the chunk hashes, then renamed over the destination, so readers never see half a file.
+
+The bandwidth can be capped with a TokenBucket, share one bucket between copies to cap them all together.
+
+example:
+    def show(progress):
+        print("{0:.0%} {1:.1f}MB/s eta {2:.0f}s".format(
+            progress["fraction"], progress["rate"] / 1048576.0, progress["eta"] or 0))
+
+    transfer.copy(cache_file, r"\\\\server\\share\\caches\\fluid.vdb", bandwidth=50 * 1024 ** 2, progress=show)
+"""
+# python
+import errno
+import os
+import shutil
+import threading
+import time
+
+# internal
+import shared.python.file as pyfile
+import shared.python.serialize as serialize
+from shared.python.imports import lazy_import
+
+hashlib = lazy_import("hashlib")
+
+CHECKPOINT_VERSION = 1
+
+# unit of resuming: a chunk is only kept when all of it made it to disk
+CHUNK_SIZE = 32 * 1024 * 1024
+# unit of reading, writing and throttling
+BLOCK_SIZE = 1024 * 1024
+
+PARTIAL_EXT = ".partial"
+
+
+class TransferCancelled(Exception):
+    """ the partial file and its checkpoint are kept, the next copy resumes from them """
+    pass
+
+
+class TransferVerifyError(IOError):
+    pass
+
+
+class TokenBucket(object):
+    """
+    Caps the throughput of whoever calls consume() to 'rate' bytes per second, allowing bursts
+    of up to 'burst' bytes. Thread safe, one bucket can be shared by several transfers.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else rate)
+        self._tokens = self.burst
+        self._time = time.time()
+        self._lock = threading.Lock()
+
+    def consume(self, amount):
+        """
+        Takes 'amount' bytes from the bucket, sleeping until they are available.
+        Returns:
+            (float) seconds slept
+        """
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.burst, self._tokens + (now - self._time) * self.rate)
+            self._time = now
+            # going into debt keeps large requests possible, the next callers pay it back
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+def _replace(src, dst):
+    """ atomic rename, except on windows where the destination has to be removed first """
+    if os.name == "nt" and os.path.exists(dst):
+        os.remove(dst)
+    os.rename(src, dst)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+class Transfer(object):
+    """
+    One resumable copy of 'src' to 'dst'. copy() and move() are the short way to use it,
+    create a Transfer to be able to cancel() it from another thread.
+
+    Args:
+        src:
+            (str) file to copy
+        dst:
+            (str) destination file path, its folder is created if needed
+        chunk_size:
+            (int) bytes copied between two checkpoints
+        bandwidth:
+            (int or TokenBucket) max bytes per second, or a bucket shared with other transfers. None to not cap.
+        progress:
+            fn(dict) called at most every 'progress_interval' seconds and once at the end of each phase with
+            phase ("copy" or "verify"), done, total, fraction, rate (bytes/s), elapsed and eta (seconds, or None)
+        verify:
+            (bool) read the copy back and compare it with the chunk hashes before renaming it into place
+        algorithm:
+            (str) hashlib algorithm of the chunk hashes and of the returned digest
+        resume:
+            (bool) continue from a previous partial copy, when there is one for the same source
+    """
+
+    def __init__(self, src, dst, chunk_size=CHUNK_SIZE, bandwidth=None, progress=None, verify=True,
+                 algorithm="sha1", resume=True, progress_interval=0.5):
+        self.src = pyfile.expand(src)
+        self.dst = pyfile.expand(dst)
+        self.partial_path = self.dst + PARTIAL_EXT
+        self.checkpoint_path = self.partial_path + ".json"
+        self.chunk_size = int(chunk_size)
+        if bandwidth is not None and not isinstance(bandwidth, TokenBucket):
+            bandwidth = TokenBucket(bandwidth, burst=min(bandwidth, BLOCK_SIZE * 4))
+        self.bucket = bandwidth
+        self.progress = progress
+        self.verify = verify
+        self.algorithm = algorithm
+        self.resume = resume
+        self.progress_interval = progress_interval
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """ stops the transfer after the current block, run() raises TransferCancelled """
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    # """ ----------------------- CHECKPOINT ------------------------ """
+
+    def _new_checkpoint(self, src_stat):
+        return {"version": CHECKPOINT_VERSION, "src": self.src, "size": src_stat.st_size,
+                "mtime": src_stat.st_mtime, "chunk_size": self.chunk_size, "algorithm": self.algorithm,
+                "chunks": list()}
+
+    def _save_checkpoint(self, checkpoint):
+        tmp_path = self.checkpoint_path + ".tmp"
+        serialize.save(tmp_path, checkpoint, indent=None, sort_keys=False)
+        _replace(tmp_path, self.checkpoint_path)
+
+    def _load_checkpoint(self, src_stat):
+        """ Returns the checkpoint of a previous copy of the same, unchanged source, or None """
+        if not os.path.isfile(self.partial_path):
+            return None
+        checkpoint = serialize.load(self.checkpoint_path)
+        if not isinstance(checkpoint, dict):
+            return None
+        same = (checkpoint.get("version") == CHECKPOINT_VERSION and checkpoint.get("src") == self.src
+                and checkpoint.get("size") == src_stat.st_size and checkpoint.get("mtime") == src_stat.st_mtime
+                and checkpoint.get("chunk_size") == self.chunk_size and checkpoint.get("algorithm") == self.algorithm)
+        return checkpoint if same else None
+
+    def _hash_range(self, f, offset, size):
+        hasher = hashlib.new(self.algorithm)
+        f.seek(offset)
+        remaining = size
+        while remaining > 0:
+            data = f.read(min(BLOCK_SIZE, remaining))
+            if not data:
+                break
+            hasher.update(data)
+            remaining -= len(data)
+        return hasher.hexdigest() if remaining <= 0 else None
+
+    def _chunk_length(self, index, total):
+        return min(self.chunk_size, total - index * self.chunk_size)
+
+    def _verified_chunks(self, checkpoint, total):
+        """
+        Returns how many chunks of the partial file can be kept. The chunks are only written to the
+        checkpoint once flushed, but the last ones are checked again in case the share lost them.
+        """
+        chunks = checkpoint["chunks"]
+        with open(self.partial_path, "rb") as f:
+            while chunks:
+                index = len(chunks) - 1
+                if self._hash_range(f, index * self.chunk_size, self._chunk_length(index, total)) == chunks[-1]:
+                    break
+                chunks.pop()
+        return len(chunks)
+
+    # """ ------------------------- RUNNING ------------------------- """
+
+    def _reporter(self, phase, total, start_done):
+        start = time.time()
+        state = {"last": 0.0}
+
+        def report(done, final=False):
+            if not self.progress:
+                return
+            now = time.time()
+            if not final and now - state["last"] < self.progress_interval:
+                return
+            state["last"] = now
+            elapsed = now - start
+            rate = (done - start_done) / elapsed if elapsed > 0 else 0.0
+            eta = (total - done) / rate if rate > 0 else None
+            self.progress({"phase": phase, "src": self.src, "dst": self.dst, "done": done, "total": total,
+                           "fraction": float(done) / total if total else 1.0, "rate": rate, "elapsed": elapsed,
+                           "eta": 0.0 if final else eta})
+        return report
+
+    def _check_cancelled(self):
+        if self._cancelled.is_set():
+            raise TransferCancelled("transfer of '{0}' cancelled, resume from '{1}'".format(
+                self.src, self.partial_path))
+
+    def _copy_chunks(self, checkpoint, total, kept):
+        offset = kept * self.chunk_size
+        report = self._reporter("copy", total, offset)
+        mode = "r+b" if kept else "wb"
+        with open(self.src, "rb") as src_file:
+            with open(self.partial_path, mode) as dst_file:
+                src_file.seek(offset)
+                dst_file.seek(offset)
+                dst_file.truncate()
+                while offset < total:
+                    hasher = hashlib.new(self.algorithm)
+                    remaining = self._chunk_length(len(checkpoint["chunks"]), total)
+                    while remaining > 0:
+                        self._check_cancelled()
+                        data = src_file.read(min(BLOCK_SIZE, remaining))
+                        if not data:
+                            raise IOError(errno.EIO, "'{0}' got shorter while being copied".format(self.src),
+                                          self.src)
+                        if self.bucket is not None:
+                            self.bucket.consume(len(data))
+                        dst_file.write(data)
+                        hasher.update(data)
+                        remaining -= len(data)
+                        offset += len(data)
+                        report(offset)
+
+                    dst_file.flush()
+                    os.fsync(dst_file.fileno())
+                    checkpoint["chunks"].append(hasher.hexdigest())
+                    self._save_checkpoint(checkpoint)
+        report(offset, final=True)
+
+    def _verify(self, checkpoint, total):
+        """ Returns the digest of the whole copy, raises TransferVerifyError on a corrupted chunk """
+        report = self._reporter("verify", total, 0)
+        whole = hashlib.new(self.algorithm)
+        with open(self.partial_path, "rb") as f:
+            for index, expected in enumerate(checkpoint["chunks"]):
+                hasher = hashlib.new(self.algorithm)
+                remaining = self._chunk_length(index, total)
+                while remaining > 0:
+                    self._check_cancelled()
+                    data = f.read(min(BLOCK_SIZE, remaining))
+                    if not data:
+                        break
+                    hasher.update(data)
+                    whole.update(data)
+                    remaining -= len(data)
+                    report(index * self.chunk_size + self._chunk_length(index, total) - remaining)
+
+                if remaining > 0 or hasher.hexdigest() != expected:
+                    # keep the good chunks, the next copy starts again from the corrupted one
+                    del checkpoint["chunks"][index:]
+                    self._save_checkpoint(checkpoint)
+                    raise TransferVerifyError(errno.EIO, "chunk {0} of '{1}' does not match the source".format(
+                        index, self.partial_path), self.partial_path)
+        report(total, final=True)
+        return whole.hexdigest()
+
+    def run(self):
+        """
+        Returns:
+            (dict) size: bytes of the file, copied: bytes copied by this run, resumed_from: offset the copy
+            started at, digest: hash of the file (None when not verified), elapsed: seconds
+        """
+        start = time.time()
+        src_stat = os.stat(self.src)
+        total = src_stat.st_size
+        pyfile.mkdir(os.path.dirname(self.dst) or ".")
+
+        checkpoint = self._load_checkpoint(src_stat) if self.resume else None
+        kept = self._verified_chunks(checkpoint, total) if checkpoint else 0
+        if not kept:
+            checkpoint = self._new_checkpoint(src_stat)
+            self._save_checkpoint(checkpoint)
+        resumed_from = kept * self.chunk_size
+
+        self._copy_chunks(checkpoint, total, kept)
+        digest = self._verify(checkpoint, total) if self.verify else None
+
+        shutil.copystat(self.src, self.partial_path)
+        _replace(self.partial_path, self.dst)
+        _remove(self.checkpoint_path)
+        return {"size": total, "copied": total - resumed_from, "resumed_from": resumed_from, "digest": digest,
+                "elapsed": time.time() - start}
+
+    def discard(self):
+        """ removes the partial file and its checkpoint, the next copy starts from zero """
+        _remove(self.partial_path)
+        _remove(self.checkpoint_path)
+        _remove(self.checkpoint_path + ".tmp")
+
+
+def copy(src, dst, **options):
+    """
+    Resumable copy of a single file, see Transfer for the options.
+    Returns:
+        (dict) see Transfer.run()
+    """
+    return Transfer(src, dst, **options).run()
+
+
+def move(src, dst, **options):
+    """
+    Renames 'src' when it is on the same device as 'dst', otherwise copies it like copy() and then
+    deletes it.
+    Returns:
+        (dict) see Transfer.run(), None if the file was simply renamed
+    """
+    src = pyfile.expand(src)
+    dst = pyfile.expand(dst)
+    pyfile.mkdir(os.path.dirname(dst) or ".")
+    try:
+        # never removes an existing 'dst' first: if the rename fails it is still there
+        os.rename(src, dst)
+        return None
+    except OSError as e:
+        if e.errno != errno.EXDEV and os.name != "nt":
+            raise
+
+    result = copy(src, dst, **options)
+    pyfile.remove(src, force=True)
+    return result
@@ -1,5 +1,9 @@
 import collections
+import hashlib
+import itertools
+import operator
 import timeit
+import weakref
 import warnings
 import os
 from functools import wraps
@@ -158,15 +162,173 @@ def get_sorted_by_most_common(data, alphabetize=False, remove_singles=False):
     return new_data
 
 
-def dict_unicode_to_string(data):
-    if isinstance(data, basestring):
-        return str(data)
-    elif isinstance(data, collections.Mapping):
-        return dict(map(dict_unicode_to_string, data.iteritems()))
-    elif isinstance(data, collections.Iterable):
-        return type(data)(map(dict_unicode_to_string, data))
-    else:
+def _is_container(obj):
+    return isinstance(obj, collections.Iterable) and not isinstance(obj, basestring)
+
+
+class StringNormalizer(object):
+    """
+    Converts unicode strings to str inside nested dicts/lists/tuples/sets.
+    
+    - walks the data with an explicit stack, so deeply nested data does not hit the recursion limit.
+    - containers that have nothing to convert are returned as is, they are never copied.
+    - converted strings go through an intern table so repeated keys share one string object.
+      Pass the same intern_table (or reuse the normalizer) to share strings across several payloads.
+    
+    An instance can also be given to serialize.load(normalizer=...) to normalize while the json is decoded.
+    
+    example:
+        normalizer = StringNormalizer()
+        data = normalizer.normalize({u"name": [u"a", u"b"]})
+        data == {"name": ["a", "b"]}
+    """
+    
+    def __init__(self, intern_table=None):
+        self.intern_table = dict() if intern_table is None else intern_table
+    
+    def string(self, value):
+        """
+        returns value as an interned str if it is unicode, otherwise returns it unchanged.
+        non ascii text is encoded to utf-8, the same bytes os.listdir returns for the name on linux,
+        so paths loaded from a cache compare equal to the ones found on disk.
+        """
+        if isinstance(value, unicode):
+            value = value.encode("utf-8")
+            return self.intern_table.setdefault(value, value)
+        return value
+    
+    def normalize(self, data, in_place=False):
+        """
+        :param data: any python object
+        :param in_place: (bool) modify mutable containers (dict, list, set) instead of building new ones.
+            Immutable containers (tuple, frozenset) that need changes are still rebuilt.
+        :return: data with every unicode string converted to str
+        """
+        if isinstance(data, basestring):
+            return self.string(data)
+        if not _is_container(data):
+            return data
+        
+        active = {id(data)}
+        stack = [(data, self._items(data), list())]
+        while True:
+            obj, items, results = stack[-1]
+            i = len(results)
+            if i < len(items):
+                child = items[i]
+                if isinstance(child, basestring):
+                    results.append(self.string(child))
+                elif _is_container(child):
+                    if id(child) in active:
+                        raise ValueError("circular reference found while normalizing strings")
+                    active.add(id(child))
+                    stack.append((child, self._items(child), list()))
+                else:
+                    results.append(child)
+                continue
+            
+            stack.pop()
+            active.discard(id(obj))
+            value = self._rebuild(obj, items, results, in_place)
+            if not stack:
+                return value
+            stack[-1][2].append(value)
+    
+    def __call__(self, pairs):
+        """
+        json object_pairs_hook. Objects are decoded inner first, so nested dicts are already normalized
+        by the time their parent is built and only lists need to be walked here.
+        """
+        string = self.string
+        result = dict()
+        for key, value in pairs:
+            if isinstance(value, unicode):
+                value = string(value)
+            elif isinstance(value, list):
+                self._normalize_decoded_list(value)
+            result[string(key)] = value
+        return result
+    
+    def finish(self, data):
+        """ normalizes what the json object_pairs_hook did not see: a top level list or string """
+        if isinstance(data, unicode):
+            return self.string(data)
+        if isinstance(data, list):
+            self._normalize_decoded_list(data)
         return data
+    
+    def _normalize_decoded_list(self, data):
+        # lists made by the json decoder are new objects, safe to change in place
+        string = self.string
+        stack = [data]
+        while stack:
+            list_ = stack.pop()
+            for i, item in enumerate(list_):
+                if isinstance(item, unicode):
+                    list_[i] = string(item)
+                elif isinstance(item, list):
+                    stack.append(item)
+    
+    @staticmethod
+    def _items(obj):
+        if isinstance(obj, collections.Mapping):
+            items = list()
+            for key, value in obj.iteritems():
+                items.append(key)
+                items.append(value)
+            return items
+        if isinstance(obj, (list, tuple)):
+            return obj
+        return list(obj)
+    
+    @staticmethod
+    def _rebuild(obj, items, results, in_place):
+        changed = [i for i in xrange(len(results)) if items[i] is not results[i]]
+        if not changed:
+            return obj
+        
+        if isinstance(obj, collections.Mapping):
+            if in_place and isinstance(obj, collections.MutableMapping):
+                # unicode and str keys compare equal, the old key has to go before the new one is set
+                for pair in sorted({i - i % 2 for i in changed}):
+                    del obj[items[pair]]
+                    obj[results[pair]] = results[pair + 1]
+                return obj
+            return dict(zip(results[::2], results[1::2]))
+        
+        if in_place and isinstance(obj, list):
+            for i in changed:
+                obj[i] = results[i]
+            return obj
+        
+        if in_place and isinstance(obj, collections.MutableSet):
+            for i in changed:
+                obj.discard(items[i])
+            for i in changed:
+                obj.add(results[i])
+            return obj
+        
+        return type(obj)(results)
+
+
+def normalize_strings(data, in_place=False, intern_table=None):
+    """
+    Converts every unicode string in data to str. See StringNormalizer.
+    
+    :param data: any python object, usually what json.load returned
+    :param in_place: (bool) modify mutable containers instead of building new ones
+    :param intern_table: (dict) shared between calls so equal strings become the same object
+    :return: the normalized data. Containers without unicode in them are returned untouched.
+    """
+    return StringNormalizer(intern_table).normalize(data, in_place=in_place)
+
+
+def dict_unicode_to_string(data):
+    """
+    Kept for backwards compatibility, use normalize_strings.
+    Unlike before, containers that have no unicode in them are returned as is instead of copied.
+    """
+    return normalize_strings(data)
 
 
 def remove_duplicates(objects, sort=False):
@@ -177,7 +339,7 @@ def remove_duplicates(objects, sort=False):
             return list(set(objects))
 
 
-def merge_dicts(dicts):
+def merge_dicts(dicts, deep=False, lazy=False):
     """
     
     Given multiple dicts, merge them into a new dict as a shallow copy.
@@ -196,11 +358,20 @@ def merge_dicts(dicts):
     creates:{'job': 'test dummy', 'name': 'jim', 'shoes': 'hiking'}
     
     :param dicts: any number of dictionary objects.
+    :param deep: (bool) nested dicts found under the same key are merged too, instead of the last one winning.
+    :param lazy: (bool) return a LayeredDict view over the dicts instead of copying them.
+        Nothing gets copied, keys are resolved through the layers when they are looked up.
     :return: a merged dictionary object.
     
     """
 
     dicts = make_list(dicts)
+    if lazy or deep:
+        layered = LayeredDict(dicts, deep=deep)
+        if lazy:
+            return layered
+        return layered.to_dict()
+    
     new_dict = {}
     for dict_ in dicts:
         new_dict.update(dict_)
@@ -208,10 +379,497 @@ def merge_dicts(dicts):
     return new_dict
 
 
-def get_object_from_path(path):
+_MISSING = object()
+
+
+class LayeredDict(collections.MutableMapping):
+    """
+    Read through view over a stack of dicts, later layers override earlier ones (same as merge_dicts).
+    Nothing is copied, a key is resolved through the layers every time it is looked up, so the layers
+    can be modified directly and the view always shows their current content.
+    
+    example:
+        config = LayeredDict([studio, project, shot])
+        user = config.push_layer()
+        user["fps"] = 30
+        config["fps"]  # 30, value from the top most layer that has "fps"
+        config.pop_layer()
+    
+    deep:
+        when the top most value of a key is a dict, the dicts found under that key in the lower
+        layers are merged with it, also lazily. Only the nested keys that are accessed get resolved.
+        Dict values are always returned as nested views, even when a single layer has the key, and
+        writes through a nested view go to a dict created on demand under the same key in the top layer.
+        The nested views are kept and reused for as long as the same dicts are found under the key.
+    
+    Writes go to the top layer. Deleting a key removes it from the top layer and hides it in the layers
+    below, the layers below are never modified. Setting the key again shows it again.
+    """
+    
+    def __init__(self, layers=None, deep=False):
+        self.layers = list(make_list(layers))
+        self.deep = deep
+        # key -> nested LayeredDict, only reused while its layers are the dicts found under the key
+        self._views = dict()
+        self._hidden = set()
+        # nested views write under their key in the write layer of the view they come from
+        self._parent = None
+        self._parent_key = None
+    
+    def push_layer(self, layer=None):
+        """
+        :param layer: (dict) new top layer. If None, an empty dict is pushed.
+        :return: the layer that was pushed, it can be edited directly
+        """
+        if layer is None:
+            layer = dict()
+        self.layers.append(layer)
+        if self._hidden:
+            self._hidden.difference_update(layer)
+        return layer
+    
+    def pop_layer(self):
+        """ removes and returns the top layer """
+        return self.layers.pop()
+    
+    def to_dict(self):
+        """ materializes the view into a regular dict, nested views included """
+        new_dict = dict()
+        for key in self:
+            value = self[key]
+            if isinstance(value, LayeredDict):
+                value = value.to_dict()
+            new_dict[key] = value
+        return new_dict
+    
+    def _resolve(self, key):
+        if key in self._hidden:
+            return _MISSING
+        found = list()
+        for layer in reversed(self.layers):
+            if key not in layer:
+                continue
+            value = layer[key]
+            if not self.deep or not isinstance(value, collections.Mapping):
+                if found:
+                    # a value that is not a dict hides the dicts in the layers below it
+                    break
+                return value
+            found.append(value)
+        
+        if not found:
+            return _MISSING
+        found.reverse()
+        view = self._views.get(key)
+        if view is None or len(view.layers) != len(found) or any(a is not b for a, b in zip(view.layers, found)):
+            view = LayeredDict(found, deep=True)
+            view._parent = self
+            view._parent_key = key
+            self._views[key] = view
+        return view
+    
+    def _write_layer(self, create=True):
+        """
+        Returns the dict writes go to: the top layer, or for a nested view the dict under its key in the
+        write layer of its parent, created if 'create' is True. None if there is none and create is False.
+        """
+        parent = self._parent
+        if parent is None:
+            if not self.layers:
+                if not create:
+                    return None
+                self.layers.append(dict())
+            return self.layers[-1]
+        
+        parent_layer = parent._write_layer(create)
+        if parent_layer is None:
+            return None
+        layer = parent_layer.get(self._parent_key)
+        if not isinstance(layer, collections.Mapping):
+            if not create:
+                return None
+            layer = dict()
+            parent_layer[self._parent_key] = layer
+            parent._hidden.discard(self._parent_key)
+        if not self.layers or self.layers[-1] is not layer:
+            self.layers.append(layer)
+        return layer
+    
+    def __getitem__(self, key):
+        value = self._resolve(key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+    
+    def __contains__(self, key):
+        if key in self._hidden:
+            return False
+        for layer in self.layers:
+            if key in layer:
+                return True
+        return False
+    
+    def __setitem__(self, key, value):
+        self._write_layer()[key] = value
+        self._hidden.discard(key)
+    
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        layer = self._write_layer(create=False)
+        if layer is None or layer.pop(key, _MISSING) is _MISSING or key in self:
+            self._hidden.add(key)
+        self._views.pop(key, None)
+    
+    def __iter__(self):
+        seen = set(self._hidden)
+        for layer in reversed(self.layers):
+            for key in layer:
+                if key not in seen:
+                    seen.add(key)
+                    yield key
+    
+    def __len__(self):
+        return sum(1 for _ in self)
+    
+    def __repr__(self):
+        return "{0}({1!r})".format(type(self).__name__, self.layers)
+
+
+# markers of the fingerprint stream. Containers always write their item count first and nested
+# containers are written as their digest, so two different structures can't produce the same stream.
+_FP_NESTED = "h"
+_NO_VALUE = object()
+
+
+def _fingerprint_unicode(value):
+    # u"a" and "a" are equal in python 2 and are saved the same in json, so they hash the same
+    value = value.encode("utf-8")
+    return "s%d:%s" % (len(value), value)
+
+
+# exact type -> canonical bytes, looked up before any isinstance check since it is the hot path
+_FP_SCALARS = {
+    type(None): lambda value: "N",
+    bool: lambda value: "T" if value else "F",
+    str: lambda value: "s%d:%s" % (len(value), value),
+    unicode: _fingerprint_unicode,
+    int: lambda value: "i%d;" % value,
+    long: lambda value: "i%d;" % value,
+    float: lambda value: "d%r;" % value,
+}
+
+
+def _fingerprint_scalar(value):
+    """ returns the canonical bytes of a scalar, None if value is not a scalar """
+    encode = _FP_SCALARS.get(type(value))
+    if encode is not None:
+        return encode(value)
+    # subclasses
+    for type_ in (bool, unicode, str, int, long, float):
+        if isinstance(value, type_):
+            return _FP_SCALARS[type_](value)
+    return None
+
+
+def _fingerprint_key(value, algorithm):
+    encoded = _fingerprint_scalar(value)
+    if encoded is None:
+        encoded = _FP_NESTED + _fingerprint_digest(value, algorithm)
+    return encoded
+
+
+def _hasher_factory(algorithm):
+    # hashlib.new looks the algorithm up on every call, the named constructors don't
+    constructor = getattr(hashlib, algorithm, None)
+    if constructor is None or algorithm.startswith("_") or algorithm in ("new", "algorithms"):
+        return lambda: hashlib.new(algorithm)
+    return constructor
+
+
+def _fingerprint_open(obj, algorithm, new_hasher):
+    """ returns the hasher of a container and an iterator of (bytes to hash first, child value) """
+    hasher = new_hasher()
+    if isinstance(obj, (list, tuple)):
+        hasher.update("[%d;" % len(obj))
+        return hasher, itertools.izip(itertools.repeat(""), obj)
+    if isinstance(obj, dict) or isinstance(obj, collections.Mapping):
+        hasher.update("{%d;" % len(obj))
+        scalars = _FP_SCALARS
+        items = [(scalars[type(key)](key) if type(key) in scalars else _fingerprint_key(key, algorithm), value)
+                 for key, value in obj.iteritems()]
+        items.sort(key=operator.itemgetter(0))
+        return hasher, iter(items)
+    if isinstance(obj, (set, frozenset)):
+        hasher.update("<%d;" % len(obj))
+        items = sorted(_fingerprint_key(item, algorithm) for item in obj)
+        return hasher, itertools.izip(items, itertools.repeat(_NO_VALUE))
+    raise TypeError("can't fingerprint {0} objects".format(type(obj).__name__))
+
+
+def _fingerprint_digest(data, algorithm):
+    new_hasher = _hasher_factory(algorithm)
+    encoded = _fingerprint_scalar(data)
+    if encoded is not None:
+        hasher = new_hasher()
+        hasher.update(encoded)
+        return hasher.digest()
+    if isinstance(data, _Tracked) and algorithm in data._digests:
+        return data._digests[algorithm]
+    
+    scalars = _FP_SCALARS
+    hasher, children = _fingerprint_open(data, algorithm, new_hasher)
+    active = {id(data)}
+    stack = [(data, hasher, children)]
+    digest = None
+    while stack:
+        obj, hasher, children = stack[-1]
+        update = hasher.update
+        if digest is not None:
+            # a nested container just finished
+            update(_FP_NESTED + digest)
+            digest = None
+        
+        nested = None
+        for prefix, child in children:
+            if prefix:
+                update(prefix)
+            type_ = type(child)
+            encode = scalars.get(type_)
+            if encode is not None:
+                update(encode(child))
+            elif type_ is dict or type_ is list:
+                nested = child
+                break
+            elif child is _NO_VALUE:
+                continue
+            elif isinstance(child, _Tracked) and algorithm in child._digests:
+                update(_FP_NESTED + child._digests[algorithm])
+            else:
+                encoded = _fingerprint_scalar(child)
+                if encoded is not None:
+                    update(encoded)
+                    continue
+                nested = child
+                break
+        
+        if nested is not None:
+            if id(nested) in active:
+                raise ValueError("circular reference found while fingerprinting")
+            active.add(id(nested))
+            child_hasher, child_children = _fingerprint_open(nested, algorithm, new_hasher)
+            stack.append((nested, child_hasher, child_children))
+            continue
+        
+        stack.pop()
+        active.discard(id(obj))
+        digest = hasher.digest()
+        if isinstance(obj, _Tracked):
+            obj._digests[algorithm] = digest
+    return digest
+
+
+def fingerprint(data, algorithm="sha1"):
+    """
+    Canonical hash of json like data (dict, list, tuple, set, str, unicode, int, float, bool, None),
+    to use as a cache key or to know if data changed without keeping a copy of it.
+    
+    - equal data gives the same fingerprint: dict key order and set order don't matter, u"a" == "a",
+      a tuple hashes like a list with the same items.
+    - the data is hashed in one pass with an explicit stack, no json string is built.
+    - TrackedDict and TrackedList remember the hash of their content, see track().
+    
+    example:
+        key = fingerprint(settings)
+        if key != last_key:
+            rebuild(settings)
+    
+    :param data: the data to hash
+    :param algorithm: (str) any hashlib algorithm
+    :return: (str) hex digest
+    """
+    return _fingerprint_digest(data, algorithm).encode("hex")
+
+
+class _Tracked(object):
+    """
+    Mixin of TrackedDict and TrackedList: remembers the fingerprint of the container until it changes.
+    A change forgets the fingerprint of the container and of the containers it is in, so after a small
+    edit only the path from the root to the edit is hashed again.
+    """
+    
+    def _init_tracking(self):
+        self._digests = dict()
+        self._parents = list()
+    
+    def _adopt(self, value):
+        if type(value) in (dict, list):
+            value = track(value)
+        if isinstance(value, _Tracked):
+            if not any(ref() is self for ref in value._parents):
+                value._parents = [ref for ref in value._parents if ref() is not None]
+                value._parents.append(weakref.ref(self))
+        return value
+    
+    def _changed(self):
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if not node._digests:
+                # the containers above it were never hashed since, or already forgot
+                continue
+            node._digests.clear()
+            for ref in node._parents:
+                parent = ref()
+                if parent is not None:
+                    stack.append(parent)
+
+
+class TrackedDict(_Tracked, dict):
+    """
+    dict that remembers its fingerprint(). Plain dicts and lists put in it are converted with track().
+    Edits made to the values through other references (a plain dict kept aside, a tuple of lists...)
+    are not seen.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self)
+        self._init_tracking()
+        self.update(*args, **kwargs)
+    
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, self._adopt(value))
+        self._changed()
+    
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._changed()
+    
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).iteritems():
+            dict.__setitem__(self, key, self._adopt(value))
+        self._changed()
+    
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+    
+    def pop(self, key, *default):
+        value = dict.pop(self, key, *default)
+        self._changed()
+        return value
+    
+    def popitem(self):
+        item = dict.popitem(self)
+        self._changed()
+        return item
+    
+    def clear(self):
+        dict.clear(self)
+        self._changed()
+    
+    def copy(self):
+        return TrackedDict(self)
+
+
+class TrackedList(_Tracked, list):
+    """ list that remembers its fingerprint(), see TrackedDict """
+    
+    def __init__(self, iterable=()):
+        list.__init__(self)
+        self._init_tracking()
+        self.extend(iterable)
+    
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = [self._adopt(v) for v in value]
+        else:
+            value = self._adopt(value)
+        list.__setitem__(self, index, value)
+        self._changed()
+    
+    def __setslice__(self, i, j, values):
+        self.__setitem__(slice(i, j), values)
+    
+    def __delitem__(self, index):
+        list.__delitem__(self, index)
+        self._changed()
+    
+    def __delslice__(self, i, j):
+        self.__delitem__(slice(i, j))
+    
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+    
+    def __imul__(self, count):
+        list.__imul__(self, count)
+        self._changed()
+        return self
+    
+    def append(self, value):
+        list.append(self, self._adopt(value))
+        self._changed()
+    
+    def extend(self, values):
+        list.extend(self, [self._adopt(v) for v in values])
+        self._changed()
+    
+    def insert(self, index, value):
+        list.insert(self, index, self._adopt(value))
+        self._changed()
+    
+    def pop(self, *index):
+        value = list.pop(self, *index)
+        self._changed()
+        return value
+    
+    def remove(self, value):
+        list.remove(self, value)
+        self._changed()
+    
+    def reverse(self):
+        list.reverse(self)
+        self._changed()
+    
+    def sort(self, *args, **kwargs):
+        list.sort(self, *args, **kwargs)
+        self._changed()
+
+
+def track(data):
+    """
+    Returns data with its dicts and lists replaced by TrackedDict and TrackedList, recursively.
+    fingerprint() of tracked data only hashes again the containers that changed since the last call.
+    
+    example:
+        scene = track(serialize.load(path))
+        scene["shots"][12]["frame_end"] = 1200
+        serialize.save(path, scene, skip_unchanged=True)  # hashes the root, "shots" and shot 12 only
+    """
+    if type(data) is dict:
+        return TrackedDict(data)
+    if type(data) is list:
+        return TrackedList(data)
+    return data
+
+
+def is_tracked(data):
+    """ Returns: (bool) True if data is a TrackedDict or TrackedList, see track() """
+    return isinstance(data, _Tracked)
+
+
+_OBJECT_PATH_CACHE = dict()
+
+
+def get_object_from_path(path, use_cache=True):
     """
     :param path:
         dot seperated path. Assumes last item is the object and first part is module
+    :param use_cache:
+        (bool) resolved objects are remembered so later calls with the same path skip the import
+        machinery. Paths that resolve to None are not cached.
     
     path(str) -
     example:
@@ -219,14 +877,35 @@ def get_object_from_path(path):
     
     you can create a path like this:
         class_path = "{0}.{1}".format(MyClass.__module__, MyClass.__name__)
+    
+    if a module gets reloaded, call clear_object_path_cache() to drop objects from the old module.
     """
 
+    if use_cache:
+        obj = _OBJECT_PATH_CACHE.get(path)
+        if obj is not None:
+            return obj
+
     module_path, _, obj_name = path.rpartition(".")
     module = __import__(module_path, globals(), locals(), [obj_name], -1)
     obj = getattr(module, obj_name, None)
+
+    if use_cache and obj is not None:
+        _OBJECT_PATH_CACHE[path] = obj
     return obj
 
 
+def clear_object_path_cache(path=None):
+    """
+    Forgets objects resolved by get_object_from_path.
+    :param path: (str) only forget this path. If None, the whole cache is cleared.
+    """
+    if path is None:
+        _OBJECT_PATH_CACHE.clear()
+    else:
+        _OBJECT_PATH_CACHE.pop(path, None)
+
+
 def time_it(func):
     """
     Helper decorator to time how long a function takes and prints the result
@@ -0,0 +1,458 @@
+"""
+Work queue that only needs a shared folder, for farming tasks across machines that share a network drive.
+
+Every task is one json file. Workers claim tasks by renaming them out of the pending folder, a rename
+is atomic so only one worker can win a task, no locks are needed. Workers keep a lease file fresh
+while they run, tasks claimed by a worker whose lease expired (crashed, lost the network...) are put
+back in the pending folder by the other workers.
+
+layout:
+    root/
+        pending/<priority>-<time>-<task_id>.task
+        claimed/<worker_id>/<priority>-<time>-<task_id>.task
+        done/<priority>-<time>-<task_id>.task
+        failed/<priority>-<time>-<task_id>.task
+        results/<task_id>.json
+        leases/<worker_id>
+        tmp/
+
+example:
+    queue = WorkQueue(r"\\\\server\\farm\\export_queue")
+    queue.put_many([{"scene": s} for s in scenes])
+
+    # on every node, as many processes as needed
+    with Worker(queue) as worker:
+        worker.run(lambda task: export(task.payload["scene"]))
+
+    results = queue.results()
+"""
+# python
+import errno
+import os
+import random
+import threading
+import time
+import uuid
+
+# internal
+import shared.python.file as pyfile
+import shared.python.serialize as serialize
+from shared.python.imports import lazy_import
+
+pysystem = lazy_import("shared.python.system")
+
+PENDING = "pending"
+CLAIMED = "claimed"
+DONE = "done"
+FAILED = "failed"
+RESULTS = "results"
+LEASES = "leases"
+TMP = "tmp"
+
+TASK_EXT = ".task"
+
+
+class TaskLost(Exception):
+    """
+    Raised when a worker finishes a task that is not claimed by it anymore.
+    Happens when the lease of the worker expired and another worker put the task back in the queue.
+    """
+    pass
+
+
+class Task(object):
+    """
+    A claimed task.
+    Attributes:
+        id: (str) unique id of the task
+        payload: whatever was given to WorkQueue.put
+        attempts: (int) how many times the task was claimed before, counting this one
+        priority: (int) lower numbers are claimed first
+        path: (str) where the task file currently is
+    """
+
+    def __init__(self, file_name, path, data):
+        self.file_name = file_name
+        self.path = path
+        self.id = data["id"]
+        self.payload = data.get("payload")
+        self.priority = data.get("priority", 0)
+        self.attempts = data.get("attempts", 0) + 1
+        self.errors = data.get("errors", list())
+
+    def __repr__(self):
+        return "<Task {0} attempt {1}>".format(self.id, self.attempts)
+
+    def to_dict(self):
+        return {"id": self.id, "payload": self.payload, "priority": self.priority,
+                "attempts": self.attempts, "errors": self.errors}
+
+
+def _replace(src, dst):
+    """ atomic rename, except on windows where the destination has to be removed first """
+    if os.name == "nt" and os.path.exists(dst):
+        os.remove(dst)
+    os.rename(src, dst)
+
+
+def _listdir_if_exists(path):
+    """ returns None if the folder does not exist anymore, a worker that stopped removes its claimed folder """
+    try:
+        return os.listdir(path)
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return None
+        raise
+
+
+def _rename_if_exists(src, dst):
+    """ returns False if src does not exist anymore, another worker got to it first """
+    try:
+        os.rename(src, dst)
+    except OSError as e:
+        if e.errno in (errno.ENOENT, errno.EEXIST, errno.EACCES):
+            return False
+        raise
+    return True
+
+
+class WorkQueue(object):
+    """
+    Args:
+        root:
+            (str) shared folder of the queue, created if it does not exist
+        lease_timeout:
+            (float) seconds after which the tasks of a worker that stopped sending heartbeats are
+            given to other workers. Keep it well above the heartbeat interval of the workers.
+        max_attempts:
+            (int) a task that failed that many times goes to the failed folder instead of back to pending.
+            Claims count as attempts when they are made, so a task whose workers keep crashing on it
+            ends up in the failed folder too.
+    """
+
+    def __init__(self, root, lease_timeout=120.0, max_attempts=3):
+        self.root = pyfile.expandnorm(root)
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        for folder in (PENDING, CLAIMED, DONE, FAILED, RESULTS, LEASES, TMP):
+            pyfile.mkdir(self.folder(folder))
+
+    def folder(self, name, *args):
+        return os.path.join(self.root, name, *args)
+
+    def _write(self, path, data):
+        # write next to the destination and rename, readers never see a partial file
+        tmp_path = self.folder(TMP, "{0}.{1}".format(uuid.uuid4().hex, os.path.basename(path)))
+        serialize.save(tmp_path, data, indent=None)
+        _replace(tmp_path, path)
+
+    def put(self, payload, priority=50, task_id=None):
+        """
+        Args:
+            payload:
+                anything serialize can save
+            priority:
+                (int) 0 to 9999, lower numbers are claimed first
+            task_id:
+                (str) defaults to a random unique id
+
+        Returns:
+            (str) the id of the task
+        """
+        task_id = task_id or uuid.uuid4().hex
+        file_name = "{0:04d}-{1:017.6f}-{2}{3}".format(priority, time.time(), task_id, TASK_EXT)
+        self._write(self.folder(PENDING, file_name),
+                    {"id": task_id, "payload": payload, "priority": priority, "attempts": 0, "errors": list()})
+        return task_id
+
+    def put_many(self, payloads, priority=50):
+        """ Returns the ids of the new tasks, in the same order as payloads """
+        return [self.put(payload, priority=priority) for payload in payloads]
+
+    def counts(self):
+        """ Returns: (dict) number of tasks per state: pending, claimed, done, failed """
+        counts = dict()
+        for folder in (PENDING, DONE, FAILED):
+            counts[folder] = len([f for f in os.listdir(self.folder(folder)) if f.endswith(TASK_EXT)])
+        counts[CLAIMED] = 0
+        for worker_id in os.listdir(self.folder(CLAIMED)):
+            file_names = _listdir_if_exists(self.folder(CLAIMED, worker_id))
+            if file_names:
+                counts[CLAIMED] += len(file_names)
+        return counts
+
+    def is_empty(self):
+        """ True when there is nothing pending or claimed """
+        counts = self.counts()
+        return not counts[PENDING] and not counts[CLAIMED]
+
+    def result(self, task_id, default=None):
+        return serialize.load(self.folder(RESULTS, task_id + ".json"), default=default)
+
+    def results(self):
+        """ Returns: (dict) task id -> result of every completed task that has one """
+        results = dict()
+        for file_name in os.listdir(self.folder(RESULTS)):
+            if file_name.endswith(".json"):
+                results[file_name[:-5]] = serialize.load(self.folder(RESULTS, file_name))
+        return results
+
+    def server_time(self):
+        """
+        Current time according to the file server, so leases are compared with the same clock
+        no matter how far the clocks of the render nodes drifted.
+        """
+        probe = self.folder(TMP, "clock-{0}".format(uuid.uuid4().hex))
+        open(probe, "w").close()
+        try:
+            return os.stat(probe).st_mtime
+        finally:
+            os.remove(probe)
+
+    def expired_workers(self):
+        """ Returns: (list) ids of the workers that hold claimed tasks but stopped renewing their lease """
+        now = self.server_time()
+        expired = list()
+        for worker_id in os.listdir(self.folder(CLAIMED)):
+            try:
+                last_heartbeat = os.stat(self.folder(LEASES, worker_id)).st_mtime
+            except OSError:
+                last_heartbeat = 0.0
+            # a worker that stopped removed its claimed folder, there is nothing left to recover from it
+            if now - last_heartbeat > self.lease_timeout and os.path.isdir(self.folder(CLAIMED, worker_id)):
+                expired.append(worker_id)
+        return expired
+
+    def recover(self, worker_id=None):
+        """
+        Puts the tasks claimed by expired workers back in the pending folder.
+        Args:
+            worker_id: (str) only recover the tasks of that worker, even if its lease has not expired.
+        Returns:
+            (int) how many tasks were recovered
+        """
+        worker_ids = [worker_id] if worker_id else self.expired_workers()
+        recovered = 0
+        for worker_id in worker_ids:
+            claimed_dir = self.folder(CLAIMED, worker_id)
+            try:
+                file_names = os.listdir(claimed_dir)
+            except OSError:
+                continue
+            for file_name in file_names:
+                if _rename_if_exists(os.path.join(claimed_dir, file_name), self.folder(PENDING, file_name)):
+                    recovered += 1
+            try:
+                os.rmdir(claimed_dir)
+            except OSError:
+                pass
+        return recovered
+
+
+class Worker(object):
+    """
+    Claims and runs tasks of a WorkQueue.
+    While the worker is used as a context manager (or between start() and stop()), a background
+    thread renews its lease every heartbeat_interval seconds.
+
+    Args:
+        queue:
+            (WorkQueue)
+        worker_id:
+            (str) must be unique among the running workers, defaults to <computer name>-<pid>-<random>
+        batch_size:
+            (int) how many tasks claim() takes at once. One listing of the pending folder serves
+            several claims, which saves metadata round trips on network drives.
+        heartbeat_interval:
+            (float) seconds, defaults to a third of the lease timeout of the queue
+    """
+
+    def __init__(self, queue, worker_id=None, batch_size=10, heartbeat_interval=None):
+        self.queue = queue
+        self.worker_id = worker_id or "{0}-{1}-{2}".format(pysystem.get_computer_name(), os.getpid(),
+                                                           uuid.uuid4().hex[:6])
+        self.batch_size = batch_size
+        self.heartbeat_interval = heartbeat_interval or queue.lease_timeout / 3.0
+        self.claimed_dir = queue.folder(CLAIMED, self.worker_id)
+        self.lease_path = queue.folder(LEASES, self.worker_id)
+
+        self._candidates = list()
+        self._last_recover = 0.0
+        self._heartbeat_thread = None
+        self._stop = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def heartbeat(self):
+        """ Renews the lease of the worker """
+        try:
+            os.utime(self.lease_path, None)
+        except OSError:
+            open(self.lease_path, "w").close()
+
+    def start(self):
+        self.heartbeat()
+        pyfile.mkdir(self.claimed_dir)
+        if self._heartbeat_thread is not None:
+            return
+        self._stop = threading.Event()
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name="work_queue_heartbeat")
+        self._heartbeat_thread.daemon = True
+        self._heartbeat_thread.start()
+
+    def stop(self, release=True):
+        """
+        Args:
+            release: (bool) put the tasks this worker still holds back in the queue and remove its lease.
+        """
+        if self._stop is not None:
+            self._stop.set()
+            self._heartbeat_thread.join()
+            self._heartbeat_thread = None
+            self._stop = None
+        if release:
+            self.queue.recover(self.worker_id)
+            try:
+                os.remove(self.lease_path)
+            except OSError:
+                pass
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self.heartbeat()
+            except (IOError, OSError):
+                # network hiccup, try again on the next beat
+                pass
+
+    def claim(self, count=None):
+        """
+        Claims up to 'count' tasks (defaults to batch_size), highest priority first.
+        Returns:
+            (list) of Task, empty if there is nothing left to claim
+        """
+        count = count or self.batch_size
+        now = time.time()
+        if now - self._last_recover > self.queue.lease_timeout:
+            self._last_recover = now
+            self.queue.recover()
+
+        pyfile.mkdir(self.claimed_dir)
+        claimed = list()
+        listed = False
+        while len(claimed) < count:
+            if not self._candidates:
+                if listed:
+                    break
+                self._candidates = self._list_candidates()
+                listed = True
+                if not self._candidates:
+                    break
+
+            file_name = self._candidates.pop(0)
+            path = os.path.join(self.claimed_dir, file_name)
+            if not _rename_if_exists(self.queue.folder(PENDING, file_name), path):
+                continue
+
+            data = serialize.load(path)
+            if data is None:
+                # unreadable task, keep it out of the way of the other workers
+                _rename_if_exists(path, self.queue.folder(FAILED, file_name))
+                continue
+
+            task = Task(file_name, path, data)
+            if task.attempts > self.queue.max_attempts:
+                # claimed that many times without being completed or failed, its workers died on it
+                task.attempts -= 1
+                task.errors.append("claimed {0} times without completing".format(task.attempts))
+                self.queue._write(path, task.to_dict())
+                _rename_if_exists(path, self.queue.folder(FAILED, file_name))
+                continue
+            # count the attempt now, a worker that crashes never gets to fail() the task
+            self.queue._write(path, task.to_dict())
+            claimed.append(task)
+        return claimed
+
+    def _list_candidates(self):
+        file_names = sorted(f for f in os.listdir(self.queue.folder(PENDING)) if f.endswith(TASK_EXT))
+        if not file_names:
+            return file_names
+
+        # Workers that list at the same time would all race for the first files, each one starts at a
+        # random place among the most urgent tasks instead.
+        priority = file_names[0].split("-", 1)[0]
+        same_priority = [f for f in file_names if f.startswith(priority)]
+        window = same_priority[:self.batch_size * 8]
+        start = random.randrange(len(window))
+        return window[start:] + window[:start] + file_names[len(window):]
+
+    def complete(self, task, result=None):
+        """
+        Moves the task to the done folder and saves its result, if any.
+        Raises TaskLost if the task was given to another worker in the meantime.
+        """
+        if result is not None:
+            self.queue._write(self.queue.folder(RESULTS, task.id + ".json"), result)
+        if not _rename_if_exists(task.path, self.queue.folder(DONE, task.file_name)):
+            raise TaskLost(task.id)
+        task.path = self.queue.folder(DONE, task.file_name)
+
+    def fail(self, task, error=None, retry=True):
+        """
+        Puts the task back in the queue, or in the failed folder once it reached the max attempts of the queue.
+        Raises TaskLost if the task was given to another worker in the meantime.
+        """
+        if error is not None:
+            task.errors.append(str(error))
+
+        if not os.path.exists(task.path):
+            raise TaskLost(task.id)
+        # save the errors in place first, the task file is only ever moved with a rename
+        self.queue._write(task.path, task.to_dict())
+
+        folder = PENDING if retry and task.attempts < self.queue.max_attempts else FAILED
+        if not _rename_if_exists(task.path, self.queue.folder(folder, task.file_name)):
+            raise TaskLost(task.id)
+        task.path = self.queue.folder(folder, task.file_name)
+
+    def run(self, handler, stop_when_empty=True, poll_interval=5.0, max_tasks=None):
+        """
+        Claims and runs tasks until the queue is empty.
+        Args:
+            handler:
+                fn(task) -> result. The result is saved in the queue, raising fails the task.
+            stop_when_empty:
+                (bool) if False, keep polling for new tasks every poll_interval seconds
+            max_tasks:
+                (int) stop after that many tasks
+        Returns:
+            (int) how many tasks were run
+        """
+        ran = 0
+        while max_tasks is None or ran < max_tasks:
+            count = self.batch_size if max_tasks is None else min(self.batch_size, max_tasks - ran)
+            tasks = self.claim(count)
+            if not tasks:
+                if stop_when_empty and self.queue.is_empty():
+                    break
+                time.sleep(poll_interval if not stop_when_empty else min(poll_interval, 1.0))
+                continue
+
+            for task in tasks:
+                try:
+                    try:
+                        result = handler(task)
+                    except Exception as e:
+                        self.fail(task, error=e)
+                    else:
+                        self.complete(task, result)
+                except TaskLost:
+                    # another worker has it now
+                    pass
+                ran += 1
+        return ran